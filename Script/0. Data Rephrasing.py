@@ -1,34 +1,77 @@
 import pandas as pd
 
-# Load and filter data (from previous steps)
-df = pd.read_csv('ProcessedData/processed_AllFishCombined_unfiltered.csv')
+input_path = 'ProcessedData/processed_AllFishCombined_unfiltered.csv'
+output_path = 'ProcessedData/AllFishCombined_filtered.csv'
+
+# Number of rows processed at a time; memory use stays bounded by the chunk size.
+# Set to None to load the whole file at once instead.
+chunksize = 100000
+
 specific_columns = {'fishNum', 'totalLength', 'weight', 'sex', 'airbladderTotalLength', 'Ping_time'}
-columns_to_keep = []
-
-for col in df.columns:
-    if col in specific_columns:
-        columns_to_keep.append(col)
-    elif col.startswith('F'):
-        try:
-            f_value = float(col[1:])
-            if 90 <= f_value and f_value <= 170:
-                # print(f"Dropping empty column: {col}")
-                continue
-            else:
-                columns_to_keep.append(col)
-        except ValueError:
-            pass
-
-filtered_df = df[columns_to_keep].copy()
-
-# Create columns that split the fishNum into speices code and index in species
-filtered_df[['Spe', 'Index']] = filtered_df['fishNum'].str.extract(r'^(BUR|LT|LWF|SMB)(\d+)$')
-
-# Convert the extracted numeric part to integer.
-filtered_df['Index'] = filtered_df['Index'].astype(int)
-
-# Save to new CSV
-filtered_df.to_csv('ProcessedData/AllFishCombined_filtered.csv', index=False)
+
+def select_columns(columns):
+    """
+    Decide which columns to keep: the specific columns above and every frequency
+    column outside of the empty F90-F170 band.
+    """
+    columns_to_keep = []
+    for col in columns:
+        if col in specific_columns:
+            columns_to_keep.append(col)
+        elif col.startswith('F'):
+            try:
+                f_value = float(col[1:])
+                if 90 <= f_value and f_value <= 170:
+                    # print(f"Dropping empty column: {col}")
+                    continue
+                else:
+                    columns_to_keep.append(col)
+            except ValueError:
+                pass
+    return columns_to_keep
+
+def rephrase(df, columns_to_keep):
+    """
+    Keep the selected columns and split fishNum into species code and index.
+    """
+    filtered_df = df[columns_to_keep].copy()
+
+    # Create columns that split the fishNum into speices code and index in species
+    filtered_df[['Spe', 'Index']] = filtered_df['fishNum'].str.extract(r'^(BUR|LT|LWF|SMB)(\d+)$')
+
+    # Convert the extracted numeric part to integer.
+    filtered_df['Index'] = filtered_df['Index'].astype(int)
+    return filtered_df
+
+if chunksize is None:
+    # Load and filter data (from previous steps)
+    df = pd.read_csv(input_path)
+    filtered_df = rephrase(df, select_columns(df.columns))
+
+    # Save to new CSV
+    filtered_df.to_csv(output_path, index=False)
+else:
+    # Decide the column projection once from the header
+    columns_to_keep = select_columns(pd.read_csv(input_path, nrows=0).columns)
+
+    # Frequency columns are parsed as floats like in a full load; the other columns are
+    # passed through as text, which keeps them identical to the pandas-written input.
+    dtypes = {col: 'float64' if col.startswith('F') else str for col in columns_to_keep}
+    reader = pd.read_csv(input_path, usecols=columns_to_keep, dtype=dtypes, chunksize=chunksize)
+
+    filtered_df = None
+    for i, chunk in enumerate(reader):
+        filtered_chunk = rephrase(chunk, columns_to_keep)
+
+        # Append each chunk to the new CSV, writing the header only once
+        filtered_chunk.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        if filtered_df is None:
+            filtered_df = filtered_chunk.head()
+
+    if filtered_df is None:
+        # Empty input: still write the header
+        filtered_df = rephrase(pd.DataFrame(columns=columns_to_keep, dtype=str), columns_to_keep)
+        filtered_df.to_csv(output_path, index=False)
 
 # validation
 print("\nSample transformed fishNum entries:")
@@ -0,0 +1,224 @@
+"""
+Benchmarks of the data pipeline on scaled-up copies of Data/sample_data.csv.
+
+Each case times one stage (loading, synthetic sample generation, spectrogram generation,
+one epoch of MLP/CNN training on CPU) at every requested scale. A scale of n concatenates
+n copies of the sample data, each copy's fish renamed so the number of fish grows too.
+Every case runs in a fresh process, so its peak RSS is not affected by the cases before it.
+Inside that process the stage runs once untimed (to pay for lazy start-up such as torch's),
+then is timed several times and the median is reported, with the spread of the runs.
+Results (rows/sec and peak RSS) are written to a JSON file, and can be compared against a
+saved baseline.
+
+Example:
+    python benchmark.py --scales 1 4 --output benchmark.json
+    python benchmark.py --scales 1 4 --output new.json --baseline benchmark.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+import pandas as pd
+import torch
+from load_dataset import load_from_path, frequency_columns
+from module import generate_synthetic_samples_for_class, generate_synthetic_samples_for_class_batched
+from resample import generate_synthetic_dataset_from_dataFrame
+from spectrogram import get_class_spectrograms, get_class_spectrograms_batched
+from models import MLP, CNNClassifier
+from trainer import train_model
+from profiling import peak_rss_mb
+
+TARGET_CLASSES = ['LT', 'SMB']
+EXCLUDE_INDIVIDUALS = ['LT008', 'LT016']
+DEFAULT_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data', 'sample_data.csv')
+
+def make_scaled_copy(data_path, scale, folder):
+    """
+    Writes scale copies of the dataset into one CSV (fish of copy i are renamed
+    '<fishNum>_<i>') and returns its path. Existing copies are reused.
+    """
+    path = os.path.join(folder, f'{os.path.splitext(os.path.basename(data_path))[0]}_x{scale}.csv')
+    if not os.path.exists(path):
+        df = pd.read_csv(data_path, low_memory=False)
+        copies = []
+        for i in range(scale):
+            copy = df.copy()
+            if i > 0:
+                copy['fishNum'] = copy['fishNum'].astype(str) + f'_{i}'
+            copies.append(copy)
+        pd.concat(copies, ignore_index=True).to_csv(path, index=False)
+    return path
+
+def _load(data_path):
+    return load_from_path(data_path, TARGET_CLASSES, EXCLUDE_INDIVIDUALS)
+
+# Each case takes (data_path, params), does its setup untimed, and returns (rows, fn): the
+# number of rows one call of fn processes, and the stage to time
+def bench_load(data_path, params):
+    rows = len(_load(data_path))
+    return rows, lambda: _load(data_path)
+
+def bench_synthetic_class(data_path, params):
+    df = _load(data_path)
+    n = params['samples']
+    return n, lambda: generate_synthetic_samples_for_class(df, 'LT', n)
+
+def bench_synthetic_class_batched(data_path, params):
+    df = _load(data_path)
+    n = params['samples']
+    return n, lambda: generate_synthetic_samples_for_class_batched(df, 'LT', n, rng=0)
+
+def bench_synthetic_dataset(data_path, params):
+    df = _load(data_path)
+    n = params['samples']
+    return 2 * n, lambda: generate_synthetic_dataset_from_dataFrame(df, samples_size=n)
+
+def bench_class_spectrograms(data_path, params):
+    df = _load(data_path)
+    n = params['spectrograms']
+    return n, lambda: get_class_spectrograms(df, 'LT', 50, n)
+
+def bench_class_spectrograms_batched(data_path, params):
+    df = _load(data_path)
+    n = params['spectrograms']
+    return n, lambda: get_class_spectrograms_batched(df, 'LT', 50, n)
+
+def bench_mlp_epoch(data_path, params):
+    df = _load(data_path)
+    X = df[frequency_columns(df.columns)].to_numpy(dtype=np.float32)
+    X = np.nan_to_num((X - np.nanmean(X, axis=0)) / (np.nanstd(X, axis=0) + 1e-8))
+    X = torch.tensor(X)
+    Y = torch.tensor((df['Spe'] == 'SMB').to_numpy(), dtype=torch.long)
+    torch.manual_seed(0)
+    model = MLP(X.shape[1])
+    # Each call trains one more epoch of the same model
+    return len(X), lambda: train_model(model, X, Y, num_epochs=1, batch_size=params['batch_size'])
+
+def bench_cnn_epoch(data_path, params):
+    df = _load(data_path)
+    n = params['spectrograms']
+    np.random.seed(0)
+    specs = [get_class_spectrograms_batched(df, spe, 50, n // 2) for spe in TARGET_CLASSES]
+    X = torch.tensor(np.nan_to_num(np.concatenate(specs)))[:, None]
+    Y = torch.tensor(np.repeat([0, 1], [len(spec) for spec in specs]), dtype=torch.long)
+    torch.manual_seed(0)
+    model = CNNClassifier(X.shape[-1], 50)
+    return len(X), lambda: train_model(model, X, Y, num_epochs=1, batch_size=params['batch_size'])
+
+BENCHMARKS = {
+    'load_from_path': bench_load,
+    'generate_synthetic_samples_for_class': bench_synthetic_class,
+    'generate_synthetic_samples_for_class_batched': bench_synthetic_class_batched,
+    'generate_synthetic_dataset_from_dataFrame': bench_synthetic_dataset,
+    'get_class_spectrograms': bench_class_spectrograms,
+    'get_class_spectrograms_batched': bench_class_spectrograms_batched,
+    'mlp_epoch': bench_mlp_epoch,
+    'cnn_epoch': bench_cnn_epoch,
+}
+
+def _run_case(name, data_path, params, num_threads, repeats):
+    torch.set_num_threads(num_threads)
+    rss_before = peak_rss_mb()
+    rows, fn = BENCHMARKS[name](data_path, params)
+    fn()  # warm-up, untimed
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    seconds = float(np.median(times))
+    return {'rows': rows, 'seconds': seconds, 'rows_per_second': rows / seconds if seconds > 0 else None,
+            'seconds_min': min(times), 'seconds_max': max(times), 'repeats': repeats,
+            'spread': (max(times) - min(times)) / seconds if seconds > 0 else 0.0,
+            'peak_rss_mb': peak_rss_mb(), 'startup_rss_mb': rss_before}
+
+def run_benchmarks(data_path = DEFAULT_DATA, scales = [1], names = None, samples = 2000, spectrograms = 200,
+                   batch_size = 256, repeats = 5, num_threads = 1, workdir = None):
+    """
+    Runs the benchmarks and returns a report dictionary: the environment and one result per
+    (benchmark, scale) with rows, seconds (the median of repeats timed runs after one
+    untimed warm-up run, all in the same fresh process), rows_per_second, the relative
+    spread (max - min) / median of the runs, and peak_rss_mb.
+    """
+    names = names or list(BENCHMARKS)
+    workdir = workdir or tempfile.mkdtemp(prefix='benchmark_')
+    os.makedirs(workdir, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+
+    results = []
+    for scale in scales:
+        scaled_path = make_scaled_copy(data_path, scale, workdir)
+        for name in names:
+            # Synthetic sample counts and spectrogram counts grow with the data
+            params = {'samples': samples * scale, 'spectrograms': spectrograms * scale, 'batch_size': batch_size}
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                run = executor.submit(_run_case, name, scaled_path, params, num_threads, repeats).result()
+            result = {'name': name, 'scale': scale, **run}
+            print(f"{name:<46} x{scale:<4} {run['rows']:>9} rows {run['seconds']:>9.3f}s (+/-{run['spread'] / 2:>4.0%}) "
+                  f"{run['rows_per_second'] or 0:>12.1f} rows/s {run['peak_rss_mb'] or 0:>8.1f} MB")
+            results.append(result)
+
+    environment = {'python': platform.python_version(), 'platform': platform.platform(), 'numpy': np.__version__,
+                   'pandas': pd.__version__, 'torch': torch.__version__, 'cpu_count': os.cpu_count(),
+                   'num_threads': num_threads, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    return {'environment': environment, 'results': results}
+
+def compare(report, baseline, tolerance = 0.25):
+    """
+    Compares the rows/sec of a report against a baseline report. Returns a list of
+    (name, scale, baseline rows/sec, rows/sec, ratio) and the list of regressions: the
+    cases slower than the baseline by more than tolerance, and by more than the spread
+    measured for the case in either report (so noisy cases are not flagged by chance).
+    """
+    baseline_results = {(result['name'], result['scale']): result for result in baseline['results']}
+    comparison, regressions = [], []
+    for result in report['results']:
+        reference = baseline_results.get((result['name'], result['scale']))
+        if reference is None or not reference['rows_per_second'] or not result['rows_per_second']:
+            continue
+        ratio = result['rows_per_second'] / reference['rows_per_second']
+        row = (result['name'], result['scale'], reference['rows_per_second'], result['rows_per_second'], ratio)
+        comparison.append(row)
+        noise = max(result.get('spread', 0.0), reference.get('spread', 0.0))
+        if ratio < 1 - max(tolerance, noise):
+            regressions.append(row)
+    return comparison, regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the data pipeline on scaled-up sample data.')
+    parser.add_argument('--data', default=DEFAULT_DATA, help='dataset to scale up (default: Data/sample_data.csv)')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1], help='number of copies of the dataset')
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), help='subset of benchmarks to run')
+    parser.add_argument('--samples', type=int, default=2000, help='synthetic samples per class at scale 1')
+    parser.add_argument('--spectrograms', type=int, default=200, help='spectrograms at scale 1')
+    parser.add_argument('--batch-size', type=int, default=256, help='training mini-batch size')
+    parser.add_argument('--repeats', type=int, default=5, help='timed runs per case after a warm-up run; the median is kept')
+    parser.add_argument('--threads', type=int, default=1, help='torch threads per case')
+    parser.add_argument('--workdir', help='where the scaled copies are written (default: a temporary folder)')
+    parser.add_argument('--output', default='benchmark.json', help='where to write the results (JSON)')
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown against the baseline')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.data, args.scales, args.benchmarks, args.samples, args.spectrograms,
+                            args.batch_size, args.repeats, args.threads, args.workdir)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparison, regressions = compare(report, baseline, args.tolerance)
+        for row in comparison:
+            name, scale, reference, current, ratio = row
+            flag = '  REGRESSION' if row in regressions else ''
+            print(f"{name:<46} x{scale:<4} {reference:>12.1f} -> {current:>12.1f} rows/s ({ratio:.2f}x){flag}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,232 @@
+"""
+Export of the PyTorch MLP/MLP_L1 and CNNClassifier models for CPU inference.
+
+The trained model is wrapped together with its frozen scaler statistics (the StandardScaler
+applied before the MLP) and, for MLPs trained on reduced features, its frozen
+feature_reduction.FrequencyReducer (band selection or PCA projection). The Linear layers are
+then quantized to int8 with dynamic quantization, and the result is traced and frozen as a
+TorchScript file that loads without the Python model classes. An ONNX export is available
+too (it needs the onnx package; quantization additionally needs onnxruntime).
+
+compare() measures the latency of the float and exported models at several batch sizes, and
+their accuracy and agreement on the same data. Run this file to export and compare both
+models on Data/sample_data.csv (add --reducer to train and export the MLP on reduced features):
+    python export.py --epochs 200 --output-dir ../Model/export
+"""
+import os
+import json
+import time
+import argparse
+import joblib
+import numpy as np
+import torch
+import torch.nn as nn
+from sklearn.preprocessing import StandardScaler
+from load_dataset import load_from_path, frequency_columns
+from spectrogram import get_class_spectrograms_batched
+from models import MLP, CNNClassifier
+from trainer import train_model, evaluate_accuracy
+
+class FrozenReducer(nn.Module):
+    """
+    A fitted feature_reduction.FrequencyReducer as torch operations on the last dimension:
+    the selected bands ('topk') or the projection onto the principal components ('pca').
+    """
+    def __init__(self, reducer):
+        super(FrozenReducer, self).__init__()
+        self.select = reducer.selected_ is not None
+        if self.select:
+            self.register_buffer('selected', torch.as_tensor(reducer.selected_, dtype=torch.long))
+        else:
+            self.register_buffer('mean', torch.as_tensor(reducer.pca_.mean_, dtype=torch.float32))
+            self.register_buffer('components', torch.as_tensor(reducer.pca_.components_.T, dtype=torch.float32))
+
+    def forward(self, x):
+        if self.select:
+            return x.index_select(-1, self.selected)
+        return (x - self.mean) @ self.components
+
+class ScaledModel(nn.Module):
+    """
+    Standardizes the inputs with frozen scaler statistics before calling the model.
+    Missing values become the feature mean (0 after scaling). The statistics broadcast over
+    the last dimension, so they apply per frequency to MLP rows and to CNN spectrograms alike.
+    An optional reducer (e.g. a FrozenReducer) is applied to the scaled inputs.
+    """
+    def __init__(self, model, mean = None, scale = None, reducer = None):
+        super(ScaledModel, self).__init__()
+        self.model = model
+        self.reducer = reducer if reducer is not None else nn.Identity()
+        num_features = len(mean) if mean is not None else 1
+        self.register_buffer('mean', torch.as_tensor(mean if mean is not None else np.zeros(num_features), dtype=torch.float32))
+        self.register_buffer('scale', torch.as_tensor(scale if scale is not None else np.ones(num_features), dtype=torch.float32))
+
+    def forward(self, x):
+        x = torch.nan_to_num((x - self.mean) / self.scale)
+        return self.model(self.reducer(x))
+
+def wrap(model, scaler = None, reducer = None):
+    """
+    Returns the model wrapped with the statistics of a fitted StandardScaler (or none) and a
+    fitted FrequencyReducer (or none), in eval mode.
+    """
+    mean = scaler.mean_ if scaler is not None else None
+    scale = scaler.scale_ if scaler is not None else None
+    frozen = FrozenReducer(reducer) if reducer is not None else None
+    return ScaledModel(model.cpu(), mean, scale, frozen).eval()
+
+def quantize(model):
+    """
+    Returns a copy of the model with int8 dynamically quantized Linear layers.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+def export_torchscript(model, example_input, path, scaler = None, int8 = True, metadata = None, reducer = None):
+    """
+    Wraps the model with its scaler (and reducer), optionally quantizes it, then traces,
+    freezes and saves it as TorchScript. metadata (e.g. classes, feature names) is stored
+    next to the graph as 'metadata.json'. Returns the saved module.
+    """
+    module = wrap(model, scaler, reducer)
+    if int8:
+        module = quantize(module)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(module, example_input.cpu()))
+    torch.jit.save(traced, path, _extra_files={'metadata.json': json.dumps(metadata or {})})
+    return traced
+
+def load_torchscript(path):
+    """
+    Loads an exported TorchScript model; returns (module, metadata).
+    """
+    extra_files = {'metadata.json': ''}
+    module = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+    return module, json.loads(extra_files['metadata.json'] or '{}')
+
+def export_onnx(model, example_input, path, scaler = None, int8 = True, reducer = None):
+    """
+    Exports the model with its scaler (and reducer) as ONNX (dynamic batch size). With int8,
+    the Linear (MatMul/Gemm) weights are then quantized with onnxruntime's dynamic
+    quantization into path, and the float graph is kept as '<path>.float.onnx'.
+    """
+    module = wrap(model, scaler, reducer)
+    float_path = path + '.float.onnx' if int8 else path
+    torch.onnx.export(module, example_input.cpu(), float_path, input_names=['input'], output_names=['logits'],
+                      dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}})
+    if int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(float_path, path, weight_type=QuantType.QInt8)
+    return path
+
+def _latency_ms(fn, X, batch_size, repeats):
+    batch = X[:batch_size]
+    with torch.no_grad():
+        fn(batch)  # warm up
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn(batch)
+            times.append(time.perf_counter() - start)
+    return 1e3 * float(np.median(times))
+
+def compare(float_model, exported, X, Y, scaler = None, batch_sizes = [1, 32, 256], repeats = 50, reducer = None):
+    """
+    Compares an exported model against the float model it came from.
+
+    The float model gets inputs standardized in NumPy with the scaler (as in the notebooks)
+    and reduced with reducer.transform; the exported model gets the raw inputs.
+
+    Returns a dict with the accuracy of each model, the fraction of identical predictions,
+    the largest absolute logit difference and, per batch size, the median latency (ms) of each.
+    """
+    float_model = float_model.cpu().eval()
+    if scaler is not None or reducer is not None:
+        shape = X.shape
+        X_scaled = X.reshape(-1, shape[-1]).numpy()
+        if scaler is not None:
+            X_scaled = scaler.transform(X_scaled)
+        X_scaled = np.nan_to_num(X_scaled)
+        if reducer is not None:
+            X_scaled = reducer.transform(X_scaled)
+        X_scaled = torch.tensor(X_scaled.reshape(*shape[:-1], -1), dtype=torch.float32)
+    else:
+        X_scaled = torch.nan_to_num(X)
+    with torch.no_grad():
+        float_logits = float_model(X_scaled)
+        exported_logits = exported(X)
+    report = {
+        'float_accuracy': (float_logits.argmax(dim=1) == Y).float().mean().item(),
+        'exported_accuracy': (exported_logits.argmax(dim=1) == Y).float().mean().item(),
+        'agreement': (float_logits.argmax(dim=1) == exported_logits.argmax(dim=1)).float().mean().item(),
+        'max_logit_difference': (float_logits - exported_logits).abs().max().item(),
+        'latency_ms': {},
+    }
+    for batch_size in batch_sizes:
+        report['latency_ms'][batch_size] = {
+            'float': _latency_ms(float_model, X_scaled, batch_size, repeats),
+            'exported': _latency_ms(exported, X, batch_size, repeats),
+        }
+    return report
+
+def print_report(name, report):
+    print(f"{name}: accuracy float {report['float_accuracy']:.4f}, exported {report['exported_accuracy']:.4f}, "
+          f"agreement {report['agreement']:.4f}, max logit difference {report['max_logit_difference']:.4f}")
+    for batch_size, latency in report['latency_ms'].items():
+        print(f"  batch {batch_size:>5}: float {latency['float']:.3f} ms, exported {latency['exported']:.3f} ms "
+              f"({latency['float'] / latency['exported']:.2f}x)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export int8 TorchScript MLP/CNN models and compare them with the float models.')
+    parser.add_argument('--data', default=os.path.join('..', 'Data', 'sample_data.csv'), help='dataset to train/compare on')
+    parser.add_argument('--mlp-state', help='state_dict of a trained MLP (trained here if not given)')
+    parser.add_argument('--scaler', help='joblib-pickled StandardScaler of the MLP (fitted on --data if not given)')
+    parser.add_argument('--reducer', help='joblib-pickled feature_reduction.FrequencyReducer the MLP takes its inputs from')
+    parser.add_argument('--cnn-state', help='state_dict of a trained CNNClassifier (trained here if not given)')
+    parser.add_argument('--epochs', type=int, default=200, help='epochs when training here')
+    parser.add_argument('--spectrograms', type=int, default=200, help='spectrograms per class for the CNN')
+    parser.add_argument('--output-dir', default=os.path.join('..', 'Model', 'export'),
+                        help='where the exported models are written (default: ../Model/export, apart from the tracked models)')
+    parser.add_argument('--no-int8', action='store_true', help='export float TorchScript without quantization')
+    parser.add_argument('--threads', type=int, default=1, help='torch threads for the latency measurement')
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    np.random.seed(0)
+    os.makedirs(args.output_dir, exist_ok=True)
+    classes = ['LT', 'SMB']
+    df = load_from_path(args.data, classes, ['LT008', 'LT016'])
+    freq_cols = frequency_columns(df.columns)
+
+    # MLP on scaled (and reduced) pings
+    scaler = joblib.load(args.scaler) if args.scaler else StandardScaler().fit(df[freq_cols].to_numpy())
+    reducer = joblib.load(args.reducer) if args.reducer else None
+    X = torch.tensor(df[freq_cols].to_numpy(dtype=np.float32))
+    Y = torch.tensor((df['Spe'] == 'SMB').to_numpy(), dtype=torch.long)
+    X_train = np.nan_to_num(scaler.transform(X.numpy()))
+    if reducer is not None:
+        X_train = reducer.transform(X_train)
+    mlp = MLP(X_train.shape[1])
+    if args.mlp_state:
+        mlp.load_state_dict(torch.load(args.mlp_state, map_location='cpu'))
+    else:
+        train_model(mlp, torch.tensor(X_train, dtype=torch.float32), Y, num_epochs=args.epochs)
+    mlp_path = os.path.join(args.output_dir, 'mlp_int8.pt' if not args.no_int8 else 'mlp_float.pt')
+    exported = export_torchscript(mlp, X[:1], mlp_path, scaler, int8=not args.no_int8, reducer=reducer,
+                                  metadata={'classes': classes, 'features': freq_cols})
+    print_report(f'MLP ({mlp_path})', compare(mlp, exported, X, Y, scaler, reducer=reducer))
+
+    # CNN on raw spectrograms
+    specs = [get_class_spectrograms_batched(df, spe, 50, args.spectrograms, 0) for spe in classes]
+    X = torch.tensor(np.nan_to_num(np.concatenate(specs)))[:, None]
+    Y = torch.tensor(np.repeat([0, 1], [len(spec) for spec in specs]), dtype=torch.long)
+    cnn = CNNClassifier(len(freq_cols), 50)
+    if args.cnn_state:
+        cnn.load_state_dict(torch.load(args.cnn_state, map_location='cpu'))
+    else:
+        train_model(cnn, X, Y, num_epochs=max(1, args.epochs // 20), lr=0.0005, batch_size=32)
+    print(f"CNN training accuracy: {evaluate_accuracy(cnn, X, Y):.4f}")
+    cnn_path = os.path.join(args.output_dir, 'cnn_int8.pt' if not args.no_int8 else 'cnn_float.pt')
+    exported = export_torchscript(cnn, X[:1], cnn_path, int8=not args.no_int8,
+                                  metadata={'classes': classes, 'features': freq_cols, 'desired_length': 50})
+    print_report(f'CNN ({cnn_path})', compare(cnn, exported, X, Y))
@@ -0,0 +1,179 @@
+"""
+Feature reduction of the ~265 frequency ('F*') columns ahead of training and inference.
+
+FrequencyReducer is a scikit-learn transformer that either
+  - projects the (scaled) frequencies onto their first k principal components with a
+    randomized PCA (method='pca'), or
+  - keeps the k most important frequency bands (method='topk'). Importance is either given
+    or estimated during fit like in the notebooks: RandomForest feature_importances_
+    ('rf') or the absolute input-layer weight sums of an MLP ('mlp').
+accuracy_by_k reports the accuracy, the training-matrix size and the prediction time for
+each k. fit_reduced_model trains a classifier on the reduced features; its PingClassifier
+saves the model with its scaler and reducer ('<model>_scaler.pkl', '<model>_reducer.pkl'),
+where inference.PingClassifier.load finds them. export.py and streaming.py accept the
+fitted reducer too.
+
+Example:
+    python feature_reduction.py --data ../Data/sample_data.csv --method pca topk --k 5 10 20 40 80
+    python feature_reduction.py --method topk --k 20 --save ../Model/mlp_top20.pkl
+"""
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.decomposition import PCA
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.preprocessing import StandardScaler
+from sklearn.pipeline import make_pipeline
+from sklearn.model_selection import KFold, cross_val_score
+from load_dataset import load_from_path, frequency_columns
+from inference import PingClassifier
+
+def rf_importance(X, y, seed = 0):
+    """
+    RandomForest feature_importances_, as in '2. Progress Report.ipynb'.
+    """
+    return RandomForestClassifier(n_estimators=100, random_state=seed, n_jobs=-1).fit(X, y).feature_importances_
+
+def mlp_importance(model):
+    """
+    Absolute input-layer weight sums of a fitted MLP, as in '3. MLP.ipynb': a scikit-learn
+    MLPClassifier, or a torch MLP/MLP_L1 from models.py.
+    """
+    if hasattr(model, 'coefs_'):
+        return np.abs(model.coefs_[0]).sum(axis=1)
+    return model.net[0].weight.detach().abs().sum(dim=0).cpu().numpy()
+
+class FrequencyReducer(TransformerMixin, BaseEstimator):
+    """
+    Reduces the frequency features to k columns.
+
+    Parameters:
+        method (str): 'pca' (randomized PCA) or 'topk' (band selection).
+        k (int): Number of components or bands kept.
+        importance (array, 'rf' or 'mlp'): For 'topk', the importance of each input feature,
+            or how to estimate it from the training data during fit.
+        random_state (int): Seed of the randomized PCA and of the importance models.
+    """
+    def __init__(self, method = 'pca', k = 20, importance = 'rf', random_state = 0):
+        self.method = method
+        self.k = k
+        self.importance = importance
+        self.random_state = random_state
+
+    def fit(self, X, y = None):
+        if isinstance(X, pd.DataFrame):
+            self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        X = np.asarray(X, dtype=float)
+        self.n_features_in_ = X.shape[1]
+        k = min(self.k, X.shape[1])
+        if self.method == 'pca':
+            self.pca_ = PCA(n_components=k, svd_solver='randomized', random_state=self.random_state).fit(X)
+            self.selected_ = None
+        elif self.method == 'topk':
+            if isinstance(self.importance, str):
+                if y is None:
+                    raise ValueError("Estimating the importance needs the labels y.")
+                if self.importance == 'rf':
+                    importance = rf_importance(X, y, self.random_state)
+                elif self.importance == 'mlp':
+                    importance = mlp_importance(MLPClassifier(hidden_layer_sizes=(64, 32, 16), random_state=self.random_state).fit(X, y))
+                else:
+                    raise ValueError(f"Unknown importance '{self.importance}'; use 'rf', 'mlp' or an array.")
+            else:
+                importance = np.asarray(self.importance, dtype=float)
+            self.importances_ = importance
+            # The k most important bands, kept in frequency order
+            self.selected_ = np.sort(np.argsort(importance)[::-1][:k])
+        else:
+            raise ValueError(f"Unknown method '{self.method}'; use 'pca' or 'topk'.")
+        return self
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=float)
+        if self.selected_ is not None:
+            return X[:, self.selected_]
+        return self.pca_.transform(X)
+
+    def selected_features(self):
+        """
+        Returns the names of the kept bands ('topk' only, if fitted on a DataFrame).
+        """
+        names = getattr(self, 'feature_names_in_', None)
+        if self.selected_ is None or names is None:
+            return None
+        return list(names[self.selected_])
+
+def save_reducer(reducer, path):
+    joblib.dump(reducer, path)
+
+def load_reducer(path):
+    return joblib.load(path)
+
+def fit_reduced_model(X, y, method = 'pca', k = 20, importance = 'rf', model_fn = None, seed = 0):
+    """
+    Fits StandardScaler -> FrequencyReducer(method, k) -> model on all of X (a DataFrame of
+    the frequency columns without missing values) and returns the inference.PingClassifier
+    holding all three, e.g. to save them together with PingClassifier.save.
+    """
+    model_fn = model_fn or (lambda: MLPClassifier(hidden_layer_sizes=(64, 32, 16), random_state=seed, max_iter=200))
+    scaler = StandardScaler().fit(X.to_numpy())
+    X_scaled = pd.DataFrame(scaler.transform(X.to_numpy()), columns=X.columns, index=X.index)
+    reducer = FrequencyReducer(method, k, importance, seed).fit(X_scaled, y)
+    model = model_fn().fit(reducer.transform(X_scaled), y)
+    return PingClassifier(model, scaler, reducer=reducer)
+
+def accuracy_by_k(X, y, ks, method = 'pca', importance = 'rf', model_fn = None, cv = None, seed = 0):
+    """
+    Cross-validates scaler -> FrequencyReducer(method, k) -> model for each k (use k = number
+    of features for the unreduced baseline).
+
+    Returns a DataFrame with, per k: mean and std accuracy, the size of the reduced training
+    matrix (MB, float64) and the prediction time per sample (microseconds) of a model fitted
+    on all of X.
+    """
+    model_fn = model_fn or (lambda: MLPClassifier(hidden_layer_sizes=(64, 32, 16), random_state=seed, max_iter=200))
+    cv = cv or KFold(n_splits=5, shuffle=True, random_state=seed)
+    rows = []
+    for k in ks:
+        pipeline = make_pipeline(StandardScaler(), FrequencyReducer(method, k, importance, seed), model_fn())
+        scores = cross_val_score(pipeline, X, y, cv=cv)
+        pipeline.fit(X, y)
+        start = time.perf_counter()
+        pipeline.predict(X)
+        seconds = time.perf_counter() - start
+        k_used = min(k, X.shape[1])
+        rows.append({'method': method, 'k': k_used, 'accuracy': scores.mean(), 'accuracy_std': scores.std(),
+                     'matrix_mb': len(X) * k_used * 8 / 2**20, 'predict_us_per_sample': 1e6 * seconds / len(X)})
+    return pd.DataFrame(rows)
+
+if __name__ == '__main__':
+    # Run as a script, this file is __main__: fit through the imported module, so the saved
+    # reducer is pickled as feature_reduction.FrequencyReducer and loads in other scripts
+    import feature_reduction
+
+    parser = argparse.ArgumentParser(description='Report the accuracy trade-off of frequency reduction for each k.')
+    parser.add_argument('--data', default='../Data/sample_data.csv', help='dataset to evaluate on')
+    parser.add_argument('--method', nargs='+', default=['pca', 'topk'], choices=['pca', 'topk'])
+    parser.add_argument('--importance', default='rf', choices=['rf', 'mlp'], help="importance used by 'topk'")
+    parser.add_argument('--k', type=int, nargs='+', default=[5, 10, 20, 40, 80], help='numbers of components/bands')
+    parser.add_argument('--save', metavar='MODEL', help='train a model on all data reduced with the first method and k, '
+                        "and save it with its scaler and reducer ('<model>_scaler.pkl', '<model>_reducer.pkl')")
+    args = parser.parse_args()
+
+    df = load_from_path(args.data, ['LT', 'SMB'], ['LT008', 'LT016'])
+    freq_cols = frequency_columns(df.columns)
+    X = df[freq_cols].fillna(df[freq_cols].mean())
+    y = df['Spe']
+
+    reports = [accuracy_by_k(X, y, args.k + [len(freq_cols)], method, args.importance) for method in args.method]
+    print(pd.concat(reports, ignore_index=True).to_string(index=False, float_format='%.4f'))
+
+    if args.save:
+        classifier = feature_reduction.fit_reduced_model(X, y, args.method[0], args.k[0], args.importance)
+        classifier.save(args.save)
+        print(f"Saved a model on the {args.method[0]} reduction with k={args.k[0]} to {args.save}, "
+              "with its scaler and reducer")
@@ -0,0 +1,154 @@
+"""
+Out-of-core training of the full-feature RandomForest and MLP baselines of the progress report.
+
+Instead of concatenating the original data with all synthetic rows into one augmented
+DataFrame, then densifying and scaling it, training streams chunks of rows:
+  - load_dataset.load_chunks reads a dataset file chunk by chunk,
+  - augmented_chunks yields the original rows mixed with synthetic rows generated chunk by
+    chunk, so the augmented dataset is never materialized.
+The StandardScaler is fitted with partial_fit, the MLPClassifier trained with partial_fit per
+chunk, and the RandomForest grown a batch of trees per chunk with warm_start. Peak memory is
+bounded by the chunk size rather than by the size of the augmented dataset.
+
+A chunk source is a function returning a fresh iterator of DataFrames, since training makes
+several passes (scaler, then each MLP epoch), e.g.
+functools.partial(load_chunks, data_path, 50000, target_classes, exclude_individuals) or
+augmented_chunks(...). Rows of load_chunks come in file order (usually fish by fish), so a
+chunk may hold a single species; prefer augmented_chunks, which shuffles, for the MLP.
+
+Example:
+    df = load_from_path(data_path, ['LT', 'SMB'], ['LT008', 'LT016'])
+    chunks = augmented_chunks(df, {'LT': 10679, 'SMB': 23852}, chunksize = 5000, noise_std = 0.01)
+    scaler = fit_scaler_incremental(chunks)
+    mlp = train_mlp_incremental(chunks, scaler, classes = ['LT', 'SMB'], epochs = 20)
+    rf = train_forest_incremental(chunks, n_estimators = 100, trees_per_chunk = 10)
+"""
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+from sklearn.neural_network import MLPClassifier
+from sklearn.ensemble import RandomForestClassifier
+from load_dataset import frequency_columns
+from module import generate_synthetic_samples_for_class_batched
+from profiling import profiled, count
+
+def augmented_chunks(df, samples_per_class, chunksize = 10000, noise_std = 1, seed = 0,
+                     generator = generate_synthetic_samples_for_class_batched):
+    """
+    Returns a chunk source over df augmented with synthetic samples, without building the
+    augmented dataset.
+
+    Every chunk holds an equal share of the (shuffled) original rows and of each class's
+    synthetic samples, generated for that chunk only and shuffled together. Chunk i draws
+    from its own RNG stream (np.random.SeedSequence(seed).spawn), so every pass yields
+    the same chunks.
+
+    Parameters:
+        df (pd.DataFrame): The loaded original dataset.
+        samples_per_class (dict): Number of synthetic samples per class, e.g. {'LT': 10679, 'SMB': 23852}.
+        chunksize (int): Approximate number of rows per chunk.
+        noise_std (float): Standard deviation of the noise added to the synthetic samples.
+        seed (int): Seed of the row order and of the synthetic samples.
+        generator (function): (df, spe, n, noise_std=, rng=) -> DataFrame; the batched
+            generator by default, or resample.generate_synthetic_samples.
+    """
+    total = len(df) + sum(samples_per_class.values())
+    num_chunks = max(1, -(-total // chunksize))
+
+    def chunks():
+        rng = np.random.default_rng(seed)
+        original_parts = np.array_split(rng.permutation(len(df)), num_chunks)
+        synthetic_counts = {spe: [len(part) for part in np.array_split(np.arange(n), num_chunks)]
+                            for spe, n in samples_per_class.items()}
+        for i, chunk_seed in enumerate(np.random.SeedSequence(seed).spawn(num_chunks)):
+            chunk_rng = np.random.default_rng(chunk_seed)
+            parts = [df.iloc[original_parts[i]]]
+            for spe, counts in synthetic_counts.items():
+                if counts[i]:
+                    parts.append(generator(df, spe, counts[i], noise_std=noise_std, rng=chunk_rng))
+            chunk = pd.concat(parts, ignore_index=True)
+            yield chunk.iloc[chunk_rng.permutation(len(chunk))]
+    return chunks
+
+@profiled()
+def fit_scaler_incremental(chunks):
+    """
+    Fits a StandardScaler on the frequency columns of every chunk with partial_fit.
+    """
+    scaler = StandardScaler()
+    for chunk in chunks():
+        scaler.partial_fit(chunk[frequency_columns(chunk.columns)])
+        count('incremental.scaler_rows', len(chunk))
+    return scaler
+
+def _scaled(chunk, scaler):
+    # Missing values are set to the feature mean (0 after scaling)
+    X = chunk[frequency_columns(chunk.columns)]
+    X = scaler.transform(X) if scaler is not None else X.to_numpy(dtype=float)
+    return np.nan_to_num(X)
+
+@profiled()
+def train_mlp_incremental(chunks, scaler, classes, epochs = 10, mlp = None, seed = 0):
+    """
+    Trains the progress report MLP (hidden layers 64, 32, 16) with partial_fit on one chunk
+    at a time, for the given number of passes over the chunk source.
+
+    Parameters:
+        chunks (function): Chunk source, e.g. a partial of load_chunks or augmented_chunks.
+        scaler (StandardScaler): Fitted scaler, e.g. from fit_scaler_incremental.
+        classes (list): All target classes ('Spe'), needed before the first chunk.
+        epochs (int): Number of passes over the chunks.
+        mlp (MLPClassifier, optional): A model to continue training.
+        seed (int): random_state of a new MLPClassifier.
+    """
+    if mlp is None:
+        mlp = MLPClassifier(hidden_layer_sizes=(64, 32, 16), random_state=seed)
+    for _ in range(epochs):
+        for chunk in chunks():
+            mlp.partial_fit(_scaled(chunk, scaler), chunk['Spe'], classes=classes)
+            count('incremental.mlp_rows', len(chunk))
+    return mlp
+
+@profiled()
+def train_forest_incremental(chunks, n_estimators = 100, trees_per_chunk = 10, seed = 0, scaler = None, **forest_kwargs):
+    """
+    Grows a RandomForestClassifier with warm_start: each chunk trains trees_per_chunk new trees
+    on that chunk only, until n_estimators trees exist (passing over the chunks again if
+    needed). A chunk missing some class is merged with the following chunks first, since every
+    tree must see every class.
+
+    The scaler is optional; trees do not need scaled features.
+    """
+    rf = RandomForestClassifier(n_estimators=0, warm_start=True, random_state=seed, **forest_kwargs)
+    classes = None
+    pending = []
+    while rf.n_estimators < n_estimators:
+        grown = rf.n_estimators
+        for chunk in chunks():
+            pending.append(chunk)
+            chunk = pd.concat(pending, ignore_index=True) if len(pending) > 1 else chunk
+            chunk_classes = set(chunk['Spe'].unique())
+            if classes is None and len(chunk_classes) > 1:
+                classes = chunk_classes
+            if classes is None or chunk_classes != classes:
+                continue
+            pending = []
+            rf.n_estimators = min(rf.n_estimators + trees_per_chunk, n_estimators)
+            rf.fit(_scaled(chunk, scaler), chunk['Spe'])
+            count('incremental.forest_rows', len(chunk))
+            if rf.n_estimators >= n_estimators:
+                break
+        if rf.n_estimators == grown:
+            raise ValueError("The chunks never contain every class; a forest cannot be grown from them.")
+    return rf
+
+def evaluate_incremental(model, chunks, scaler = None):
+    """
+    Returns the accuracy of a fitted model over every chunk of a chunk source.
+    """
+    correct = 0
+    total = 0
+    for chunk in chunks():
+        correct += (model.predict(_scaled(chunk, scaler)) == chunk['Spe'].to_numpy()).sum()
+        total += len(chunk)
+    return correct / total if total else float('nan')
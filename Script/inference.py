@@ -0,0 +1,258 @@
+"""
+Batch inference for the pickled scikit-learn classifiers in Model/ (e.g. mlp_reduced.pkl,
+or rf_full.pkl / rf_reduced.pkl / mlp_full.pkl written by the progress report).
+
+The model and its StandardScaler are loaded once and kept warm. Pings can be passed as
+DataFrames, CSV files or arrays of the F45-F260 frequency columns, and the classifier
+returns species probabilities. MicroBatcher groups many small concurrent requests into
+one model call.
+
+Example:
+    python inference.py --model ../Model/mlp_reduced.pkl --scaler ../Model/scaler_reduced.pkl \
+        --csv ../Data/sample_data.csv --output probabilities.csv
+
+The scaler should be the one the model was trained with. PingClassifier.save writes it
+next to the model ('<model>_scaler.pkl'), with the feature_reduction.FrequencyReducer of
+models trained on reduced features ('<model>_reducer.pkl'), where load finds them without
+--scaler and --reducer. For models saved without their scaler, --fit-scaler refits one on
+the training data as a fallback.
+"""
+import os
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.preprocessing import StandardScaler
+from load_dataset import load_from_path, frequency_columns
+
+def default_scaler_path(model_path):
+    """
+    Returns where the training scaler of a model is saved: '<model>_scaler.pkl'.
+    """
+    root, ext = os.path.splitext(model_path)
+    return f'{root}_scaler{ext or ".pkl"}'
+
+def default_reducer_path(model_path):
+    """
+    Returns where the feature reducer of a model is saved: '<model>_reducer.pkl'.
+    """
+    root, ext = os.path.splitext(model_path)
+    return f'{root}_reducer{ext or ".pkl"}'
+
+def fit_scaler(data_path, target_classes = ['LT', 'SMB'], exclude_individuals = ['LT008', 'LT016'], scaler_path = None):
+    """
+    Fits a StandardScaler on the frequency columns of a dataset, and saves it with joblib
+    if scaler_path is given, so it does not have to be refit every session.
+
+    This only reproduces the training statistics if data_path is the data the model was
+    trained on; prefer the scaler saved with the model (see PingClassifier.save).
+    """
+    df = load_from_path(data_path, target_classes, exclude_individuals)
+    scaler = StandardScaler().fit(df[frequency_columns(df.columns)].to_numpy())
+    if scaler_path is not None:
+        joblib.dump(scaler, scaler_path)
+    return scaler
+
+class PingClassifier:
+    """
+    A warm classifier for batches of pings.
+
+    Parameters:
+        model: A fitted scikit-learn classifier with predict_proba.
+        scaler (optional): The fitted StandardScaler applied before the model.
+        reducer (optional): A fitted feature_reduction.FrequencyReducer applied after the
+            scaler, for models trained on reduced features.
+        n_jobs (int, optional): Threads used by models that support it (the RandomForest
+            predicts its trees on a joblib thread pool).
+    """
+    def __init__(self, model, scaler = None, n_jobs = None, reducer = None):
+        self.model = model
+        self.scaler = scaler
+        self.reducer = reducer
+        # Scalers fitted on DataFrames (e.g. incremental.fit_scaler_incremental) expect their column names
+        self._scaler_columns = getattr(scaler, 'feature_names_in_', None)
+        if n_jobs is not None and 'n_jobs' in model.get_params():
+            model.set_params(n_jobs=n_jobs)
+        self.classes = list(model.classes_)
+        self.num_features = reducer.n_features_in_ if reducer is not None else model.n_features_in_
+        self.pings = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+        # Warm up once so the first real request does not pay for lazy initialization
+        self.predict_proba(np.zeros((1, self.num_features)))
+        self.pings = 0
+        self.seconds = 0.0
+
+    @classmethod
+    def load(cls, model_path, scaler_path = None, n_jobs = None, reducer_path = None):
+        """
+        Loads a joblib-pickled model (and scaler and reducer) once. Without scaler_path or
+        reducer_path, the ones saved next to the model by save() are used if there are any.
+        """
+        if scaler_path is None and os.path.exists(default_scaler_path(model_path)):
+            scaler_path = default_scaler_path(model_path)
+        if reducer_path is None and os.path.exists(default_reducer_path(model_path)):
+            reducer_path = default_reducer_path(model_path)
+        scaler = joblib.load(scaler_path) if scaler_path is not None else None
+        reducer = joblib.load(reducer_path) if reducer_path is not None else None
+        return cls(joblib.load(model_path), scaler, n_jobs, reducer)
+
+    def save(self, model_path, scaler_path = None, reducer_path = None):
+        """
+        Saves the model with joblib, and its training scaler and reducer (if any) next to it
+        (default_scaler_path, default_reducer_path) unless other paths are given.
+        """
+        joblib.dump(self.model, model_path)
+        if self.scaler is not None:
+            joblib.dump(self.scaler, scaler_path or default_scaler_path(model_path))
+        if self.reducer is not None:
+            joblib.dump(self.reducer, reducer_path or default_reducer_path(model_path))
+
+    def to_matrix(self, pings):
+        """
+        Converts a DataFrame (its frequency columns are used) or an array of pings into a float matrix.
+        """
+        if isinstance(pings, pd.DataFrame):
+            pings = pings[frequency_columns(pings.columns)]
+        matrix = np.asarray(pings, dtype=float)
+        if matrix.ndim == 1:
+            matrix = matrix[np.newaxis, :]
+        if matrix.shape[1] != self.num_features:
+            raise ValueError(f"Expected {self.num_features} frequency columns, got {matrix.shape[1]}.")
+        return matrix
+
+    def predict_proba(self, pings):
+        """
+        Returns the species probabilities of a batch of pings, as an array of shape
+        (num_pings, num_classes) with columns in the order of self.classes.
+        """
+        start = time.perf_counter()
+        X = self.to_matrix(pings)
+        if self.scaler is not None:
+            if self._scaler_columns is not None:
+                X = pd.DataFrame(X, columns=self._scaler_columns)
+            X = self.scaler.transform(X)
+        if self.reducer is not None:
+            X = self.reducer.transform(X)
+        proba = self.model.predict_proba(X)
+        with self._lock:
+            self.pings += len(X)
+            self.seconds += time.perf_counter() - start
+        return proba
+
+    def predict_csv(self, csv_path, chunksize = 100000):
+        """
+        Classifies every ping of a CSV file, reading it in chunks.
+        Returns a DataFrame with fishNum (if present) and one probability column per species.
+        """
+        results = []
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, low_memory=False):
+            result = pd.DataFrame(self.predict_proba(chunk), columns=self.classes, index=chunk.index)
+            if 'fishNum' in chunk.columns:
+                result.insert(0, 'fishNum', chunk['fishNum'])
+            results.append(result)
+        return pd.concat(results)
+
+    def throughput(self):
+        """
+        Returns the number of pings classified, the time spent and the pings per second.
+        """
+        with self._lock:
+            pings, seconds = self.pings, self.seconds
+        return {'pings': pings, 'seconds': seconds, 'pings_per_second': pings / seconds if seconds > 0 else 0.0}
+
+class MicroBatcher:
+    """
+    Groups concurrent classification requests into micro-batches.
+
+    submit() returns a Future at once. A background thread waits at most max_delay seconds
+    (or until max_batch_size pings are queued), classifies all queued pings with a single
+    predict_proba call and resolves each request's Future with its own rows.
+    """
+    def __init__(self, classifier, max_batch_size = 4096, max_delay = 0.005):
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, pings):
+        """
+        Queues a batch of pings; returns a Future of its probabilities.
+        """
+        future = Future()
+        self._queue.put((self.classifier.to_matrix(pings), future))
+        return future
+
+    def close(self):
+        """
+        Processes the remaining requests and stops the background thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            request = self._queue.get()
+            if request is None:
+                break
+            requests = [request]
+            size = len(request[0])
+            deadline = time.perf_counter() + self.max_delay
+            while size < self.max_batch_size:
+                try:
+                    request = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            try:
+                proba = self.classifier.predict_proba(np.concatenate([pings for pings, _ in requests]))
+            except Exception as error:
+                for _, future in requests:
+                    future.set_exception(error)
+                continue
+            offset = 0
+            for pings, future in requests:
+                future.set_result(proba[offset:offset + len(pings)])
+                offset += len(pings)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Classify pings with a pickled model.')
+    parser.add_argument('--model', required=True, help='joblib-pickled classifier, e.g. ../Model/mlp_reduced.pkl')
+    parser.add_argument('--scaler', help="joblib-pickled StandardScaler used by the model (default: '<model>_scaler.pkl' if it exists)")
+    parser.add_argument('--fit-scaler', metavar='DATA', help='fit the scaler on this dataset and save it to --scaler first')
+    parser.add_argument('--csv', required=True, help='CSV file of pings (F45-F260 columns)')
+    parser.add_argument('--output', help='where to write the probabilities (CSV)')
+    parser.add_argument('--chunksize', type=int, default=100000, help='rows read and classified at a time')
+    parser.add_argument('--reducer', help="joblib-pickled feature_reduction.FrequencyReducer used by the model "
+                        "(default: '<model>_reducer.pkl' if it exists)")
+    parser.add_argument('--n-jobs', type=int, default=None, help='threads for models that support it (RandomForest)')
+    args = parser.parse_args()
+
+    if args.fit_scaler:
+        args.scaler = args.scaler or default_scaler_path(args.model)
+        fit_scaler(args.fit_scaler, scaler_path=args.scaler)
+
+    classifier = PingClassifier.load(args.model, args.scaler, args.n_jobs, args.reducer)
+    if classifier.scaler is None:
+        print("Warning: no scaler found; the pings are classified unscaled.")
+    probabilities = classifier.predict_csv(args.csv, args.chunksize)
+    if args.output:
+        probabilities.to_csv(args.output, index=False)
+    else:
+        print(probabilities.head())
+
+    report = classifier.throughput()
+    print(f"Classified {report['pings']} pings in {report['seconds']:.3f}s ({report['pings_per_second']:.0f} pings/s)")
@@ -1,7 +1,13 @@
+import os
+import json
+import hashlib
+import shutil
 import pandas as pd
 import numpy as np
+from profiling import profiled
 
-def load_from_path(data_path, target_classes = [], exclude_individuals = []):
+@profiled()
+def load_from_path(data_path, target_classes = [], exclude_individuals = [], use_cache = False, cache_dir = None, ping_time_us = False):
     """
     Load a dataset from given file path and pre-process it:
       - Load file from given path.
@@ -9,21 +15,348 @@ def load_from_path(data_path, target_classes = [], exclude_individuals = []):
       - Filter to keep only the target classes if specified.
       - Exclude fishNum that does not want.
     Returns a DataFrame in the expected format, containing only relevant information.
+    
+    If use_cache is True, the pre-processed file is stored once as a binary cache (see
+    write_cache) and later loads memory-map it instead of re-parsing the CSV. The cache
+    is rebuilt automatically whenever the source file changes. Frequency columns served
+    from the cache are float32, and the filters are applied to the memory-mapped arrays
+    so that only the selected rows are read (see read_cache). The rows keep the labels
+    they have without the cache (their line number in the file).
+    
+    If ping_time_us is True, Ping_time is parsed once into int64 microseconds since
+    midnight (see to_ping_time_us); use format_ping_time to turn it back into strings.
+    """
+    if use_cache:
+        df = load_cached(data_path, cache_dir, target_classes, exclude_individuals)
+    else:
+        df = _read_csv(data_path)
+
+        # Filter to the target classes
+        if (target_classes):
+            df = df[df['Spe'].isin(target_classes)]
+
+        # Mannually exclude fishNum that does not want if avaiable
+        if (exclude_individuals):
+            df = df[~df['fishNum'].isin(exclude_individuals)]
+
+    if ping_time_us:
+        df = df.assign(Ping_time=to_ping_time_us(df['Ping_time']))
+
+    return df
+
+def load_chunks(data_path, chunksize = 100000, target_classes = [], exclude_individuals = [], use_cache = False, cache_dir = None, ping_time_us = False):
+    """
+    Load a dataset chunk by chunk, pre-processed and filtered like load_from_path.
+    Yields DataFrames of at most chunksize rows (before filtering), in file order, so the
+    whole file is never held in memory.
+
+    If use_cache is True, each chunk is read from a row range of the memory-mapped binary
+    cache (built from the CSV on first use, see load_cached) instead of being parsed from
+    the CSV.
+    """
+    if use_cache:
+        cache_dir = cache_dir or default_cache_dir(data_path)
+        load_cached(data_path, cache_dir, rows=slice(0, 0))  # build or validate the cache only
+        chunks = (read_cache(cache_dir, None, target_classes, exclude_individuals, slice(start, start + chunksize))
+                  for start in range(0, cache_num_rows(cache_dir), chunksize))
+    else:
+        chunks = (_filter(_prepare_columns(chunk), target_classes, exclude_individuals)
+                  for chunk in pd.read_csv(data_path, chunksize=chunksize, low_memory=False))
+
+    for chunk in chunks:
+        if ping_time_us:
+            chunk = chunk.assign(Ping_time=to_ping_time_us(chunk['Ping_time']))
+        if len(chunk):
+            yield chunk
+
+@profiled()
+def _read_csv(data_path):
+    """
+    Read the CSV file, drop the fish measurement columns and reorder the columns.
     """
     # Load the dataset
-    df = pd.read_csv(data_path, low_memory=False)
-    df = df.drop(columns=['airbladderTotalLength', 'totalLength', 'weight', 'sex'], errors='ignore')
+    return _prepare_columns(pd.read_csv(data_path, low_memory=False))
 
-    # Reorder the columns
-    new_order = ['fishNum', 'Spe', 'Index'] + [col for col in df.columns if col not in ['fishNum', 'Spe', 'Index']]
-    df = df[new_order]
+def frequency_columns(columns):
+    """
+    Returns the frequency ('F*') columns, in order.
+    """
+    return [col for col in columns if col.startswith('F')]
 
-    # Filter to the target classes
+def _filter(df, target_classes, exclude_individuals):
     if (target_classes):
         df = df[df['Spe'].isin(target_classes)]
-
-    # Mannually exclude fishNum that does not want if avaiable
     if (exclude_individuals):
         df = df[~df['fishNum'].isin(exclude_individuals)]
+    return df
+
+def _prepare_columns(df):
+    # Drop the fish measurement columns and reorder the columns
+    df = df.drop(columns=['airbladderTotalLength', 'totalLength', 'weight', 'sex'], errors='ignore')
+    new_order = ['fishNum', 'Spe', 'Index'] + [col for col in df.columns if col not in ['fishNum', 'Spe', 'Index']]
+    return df[new_order]
+
+def file_fingerprint(path, block_size = 1 << 16):
+    """
+    Returns a cheap fingerprint of a file: its size, modification time and a hash
+    of its first and last block_size bytes.
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        digest.update(f.read(block_size))
+        if stat.st_size > block_size:
+            f.seek(max(stat.st_size - block_size, block_size))
+            digest.update(f.read(block_size))
+    return f"{stat.st_size}-{stat.st_mtime_ns}-{digest.hexdigest()}"
+
+def frame_fingerprint(df, columns = None):
+    """
+    Returns a hash of the content of a DataFrame: the names and values of the given
+    columns (all by default) and the row labels.
+    """
+    df = df if columns is None else df[list(columns)]
+    digest = hashlib.sha1()
+    digest.update(json.dumps([str(col) for col in df.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def default_cache_dir(data_path):
+    """
+    Returns the default cache folder for a data file: '.cache/<file name>' next to it.
+    """
+    folder, name = os.path.split(os.path.abspath(data_path))
+    return os.path.join(folder, '.cache', name)
 
+@profiled()
+def write_cache(df, cache_dir, fingerprint = None, features_dtype = np.float32):
+    """
+    Write a DataFrame to cache_dir as a binary columnar cache:
+      - features.npy: matrix of the frequency ('F*') columns (float32 by default).
+      - one .npy file per remaining column (strings stored as fixed-width unicode).
+      - index.npy: the row labels, if they are integers.
+      - meta.json: column order and the fingerprint of the source, written last.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)  # invalidate before overwriting any array
+
+    freq_cols = [col for col in frequency_columns(df.columns) if pd.api.types.is_numeric_dtype(df[col])]
+    other_cols = [col for col in df.columns if col not in freq_cols]
+    np.save(os.path.join(cache_dir, 'features.npy'), df[freq_cols].to_numpy(dtype=features_dtype))
+
+    string_cols = []
+    for i, col in enumerate(other_cols):
+        values = df[col]
+        if pd.api.types.is_numeric_dtype(values):
+            array = values.to_numpy()
+        else:
+            # Empty strings never come out of read_csv, so they can encode missing values
+            array = values.fillna('').astype(str).to_numpy(dtype=str)
+            string_cols.append(col)
+        np.save(os.path.join(cache_dir, f'col{i}.npy'), array)
+
+    has_index = pd.api.types.is_integer_dtype(df.index)
+    if has_index:
+        np.save(os.path.join(cache_dir, 'index.npy'), df.index.to_numpy(dtype=np.int64))
+
+    meta = {'fingerprint': fingerprint, 'columns': list(df.columns), 'freq_cols': freq_cols,
+            'other_cols': other_cols, 'string_cols': string_cols, 'index': has_index}
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+@profiled()
+def read_cache(cache_dir, fingerprint = None, target_classes = [], exclude_individuals = [], rows = None):
+    """
+    Memory-map a cache written by write_cache and return it as a DataFrame.
+    Returns None if there is no complete cache, or if its fingerprint does not match.
+
+    The rows are selected on the memory-mapped arrays before the DataFrame is built:
+    rows (a slice) restricts them to a range, then target_classes and exclude_individuals
+    filter them like load_from_path. Without filters the frequency columns of the frame
+    are a view of the memory map (copy-on-write) and nothing is read until used; with
+    filters only the selected rows are copied into memory.
+
+    The rows keep the labels stored by write_cache (their positions in the cache if the
+    labels were not integers), so a filtered or chunked read is labelled like the same
+    selection of the frame that was written.
+    """
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if fingerprint is not None and meta['fingerprint'] != fingerprint:
+        return None
+
+    rows = rows if rows is not None else slice(None)
+    columns = {col: np.load(os.path.join(cache_dir, f'col{i}.npy'), mmap_mode='c')[rows]
+               for i, col in enumerate(meta['other_cols'])}
+    features = np.load(os.path.join(cache_dir, 'features.npy'), mmap_mode='c')[rows]
+    if meta.get('index'):
+        index = np.load(os.path.join(cache_dir, 'index.npy'), mmap_mode='r')[rows]
+    else:
+        index = np.arange(*rows.indices(cache_num_rows(cache_dir)))
+
+    selected = None
+    if target_classes:
+        selected = np.isin(columns['Spe'], target_classes)
+    if exclude_individuals:
+        keep = ~np.isin(columns['fishNum'], exclude_individuals)
+        selected = keep if selected is None else selected & keep
+    if selected is not None:
+        selected = np.flatnonzero(selected)
+        features = features[selected]
+        index = index[selected]
+        columns = {col: array[selected] for col, array in columns.items()}
+
+    # Build the frame around the (single) feature matrix so that it is not copied, then
+    # insert the other columns at their positions
+    index = pd.Index(np.asarray(index, dtype=np.int64))
+    df = pd.DataFrame(features, columns=meta['freq_cols'], index=index, copy=False)
+    for col in sorted(columns, key=meta['columns'].index):
+        array = columns[col]
+        values = pd.Series(array, index=index).replace('', np.nan) if col in meta['string_cols'] else array
+        df.insert(meta['columns'].index(col), col, values)
+    return df
+
+def cache_num_rows(cache_dir):
+    """
+    Returns the number of rows stored in a cache written by write_cache.
+    """
+    return np.load(os.path.join(cache_dir, 'features.npy'), mmap_mode='r').shape[0]
+
+def load_cached(data_path, cache_dir = None, target_classes = [], exclude_individuals = [], rows = None):
+    """
+    Load the pre-processed dataset through the binary cache, (re)building the cache
+    from the CSV first if it is missing or stale. The rows are selected as in read_cache.
+    """
+    cache_dir = cache_dir or default_cache_dir(data_path)
+    fingerprint = file_fingerprint(data_path)
+    df = read_cache(cache_dir, fingerprint, target_classes, exclude_individuals, rows)
+    if df is None:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        write_cache(_read_csv(data_path), cache_dir, fingerprint)
+        df = read_cache(cache_dir, fingerprint, target_classes, exclude_individuals, rows)
     return df
+
+@profiled()
+def to_ping_time_us(ping_times):
+    """
+    Convert Ping_time values into int64 microseconds since midnight.
+    Accepts ' %H:%M:%S.%f' strings, or values that are already integer microseconds.
+    Returns an int64 NumPy array.
+    """
+    ping_times = pd.Series(ping_times)
+    if pd.api.types.is_integer_dtype(ping_times):
+        return ping_times.to_numpy(dtype=np.int64)
+    deltas = pd.to_timedelta(ping_times.astype(str).str.strip())
+    return deltas.to_numpy().astype('timedelta64[us]').astype(np.int64)
+
+def format_ping_time(ping_time_us, time_format = ' %H:%M:%S.%f'):
+    """
+    Format int64 microseconds since midnight as Ping_time strings (the original
+    ' %H:%M:%S.%f' format by default). Returns a NumPy array of strings.
+    """
+    microseconds = np.asarray(ping_time_us, dtype=np.int64)
+    return pd.to_datetime(microseconds, unit='us').strftime(time_format).to_numpy()
+
+class FishPingDataset:
+    """
+    Array-backed view of a loaded dataset, indexed by fish and species.
+    
+    Rows are grouped so that every species, and every fish within it, occupies one
+    contiguous block (fish keep their order of first appearance, and rows keep their
+    original order within each fish). This lets samplers slice a fish or species in O(1)
+    instead of filtering the DataFrame with boolean masks.
+    
+    Attributes:
+        features (np.ndarray): C-contiguous float32 matrix (num_rows, num_freqs) of the frequency columns.
+        freq_cols (list): Names of the frequency columns, in matrix order.
+        ping_us (np.ndarray): Ping_time of each row as int64 microseconds since midnight.
+        fish (np.ndarray): fishNum of each row.
+        species (np.ndarray): Spe of each row.
+        fish_offsets (dict): fishNum -> (start, stop) row range.
+        species_offsets (dict): Spe -> (start, stop) row range.
+        species_fish (dict): Spe -> list of fishNum of that species.
+    """
+    def __init__(self, df):
+        self.freq_cols = frequency_columns(df.columns)
+        
+        # Group by species first, then by fish; lexsort is stable so row order within a fish is kept
+        species_codes, species_labels = pd.factorize(df['Spe'])
+        fish_codes, fish_labels = pd.factorize(df['fishNum'])
+        order = np.lexsort((fish_codes, species_codes))
+        
+        self.features = np.ascontiguousarray(df[self.freq_cols].to_numpy(dtype=np.float32)[order])
+        self.ping_us = to_ping_time_us(df['Ping_time'])[order]
+        self.fish = df['fishNum'].to_numpy()[order]
+        self.species = df['Spe'].to_numpy()[order]
+        
+        # Precompute the row range of each fish and species
+        self.fish_offsets = {}
+        self.species_offsets = {}
+        self.species_fish = {}
+        fish_sorted = fish_codes[order]
+        species_sorted = species_codes[order]
+        fish_bounds = np.flatnonzero(np.diff(fish_sorted)) + 1
+        fish_starts = np.concatenate(([0], fish_bounds)).astype(int).tolist()
+        fish_stops = np.concatenate((fish_bounds, [len(order)])).astype(int).tolist()
+        for start, stop in zip(fish_starts, fish_stops):
+            fish = fish_labels[fish_sorted[start]]
+            spe = species_labels[species_sorted[start]]
+            self.fish_offsets[fish] = (start, stop)
+            self.species_fish.setdefault(spe, []).append(fish)
+            spe_start, _ = self.species_offsets.get(spe, (start, stop))
+            self.species_offsets[spe] = (spe_start, stop)
+    
+    @classmethod
+    def from_path(cls, data_path, target_classes = [], exclude_individuals = []):
+        """
+        Load a dataset with load_from_path and build a FishPingDataset from it.
+        """
+        return cls(load_from_path(data_path, target_classes, exclude_individuals))
+    
+    def __len__(self):
+        return len(self.features)
+    
+    @property
+    def ping_seconds(self):
+        """
+        Ping_time of each row as float64 seconds since midnight.
+        """
+        return self.ping_us / 1e6
+    
+    def fish_rows(self, fish):
+        """
+        Returns the slice of rows belonging to the given fishNum.
+        """
+        return slice(*self.fish_offsets[fish])
+    
+    def species_rows(self, spe):
+        """
+        Returns the slice of rows belonging to the given species.
+        """
+        return slice(*self.species_offsets[spe])
+    
+    def fish_of_species(self, spe):
+        """
+        Returns the list of fishNum of the given species, in order of first appearance.
+        """
+        return self.species_fish.get(spe, [])
+    
+    def numpy(self, rows = slice(None)):
+        """
+        Returns a zero-copy NumPy view of the frequency matrix (optionally restricted to a row slice).
+        """
+        return self.features[rows]
+    
+    def torch(self, rows = slice(None)):
+        """
+        Returns a zero-copy torch.Tensor sharing memory with the frequency matrix.
+        """
+        import torch
+        return torch.from_numpy(self.features[rows])
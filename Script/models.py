@@ -0,0 +1,79 @@
+import torch
+import torch.nn as nn
+
+# An MLP with three hidden layers: 64, 32, 16 neurons, and an output layer with 2 neurons
+class MLP(nn.Module):
+    def __init__(self, input_dim):
+        super(MLP, self).__init__()
+        self.net = nn.Sequential(
+            nn.Linear(input_dim, 64),
+            nn.ReLU(),
+            nn.Linear(64, 32),
+            nn.ReLU(),
+            nn.Linear(32, 16),
+            nn.ReLU(),
+            nn.Linear(16, 2)  # two outputs for two classes
+        )
+
+    def forward(self, x):
+        return self.net(x)
+
+# A Dropout-Based MLP which prevents overfitting by dropping 50% of each hidden layer.
+class MLP_Dropout(nn.Module):
+    def __init__(self, input_dim):
+        super(MLP_Dropout, self).__init__()
+        self.net = nn.Sequential(
+            nn.Linear(input_dim, 64),
+            nn.ReLU(),
+            nn.Dropout(0.5),       # Dropout with 50% probability
+            nn.Linear(64, 32),
+            nn.ReLU(),
+            nn.Dropout(0.5),       # Another dropout layer
+            nn.Linear(32, 16),
+            nn.ReLU(),
+            nn.Linear(16, 2)       # Output layer with 2 classes
+        )
+
+    def forward(self, x):
+        return self.net(x)
+
+class MLP_L1(nn.Module):
+    def __init__(self, input_dim):
+        super(MLP_L1, self).__init__()
+        self.net = nn.Sequential(
+            nn.Linear(input_dim, 64),
+            nn.ReLU(),
+            nn.Linear(64, 32),
+            nn.ReLU(),
+            nn.Linear(32, 16),
+            nn.ReLU(),
+            nn.Linear(16, 2)  # 2 outputs for 2 classes
+        )
+
+    def forward(self, x):
+        return self.net(x)
+
+class CNNClassifier(nn.Module):
+    def __init__(self, num_freqs, desired_length = 50):
+        super(CNNClassifier, self).__init__()
+        # First convolution: input channels 1, output 16
+        self.conv1 = nn.Conv2d(1, 16, kernel_size=3, padding=1)
+        # Second convolution: from 16 to 32 channels
+        self.conv2 = nn.Conv2d(16, 32, kernel_size=3, padding=1)
+        # Pooling layer (2x2 max pooling)
+        self.pool = nn.MaxPool2d(2, 2)
+
+        # Calculate the size after two pooling layers
+        # Assuming desired_length and num_freqs are divisible by 4; if not, use floor division.
+        self.flat_dim = 32 * (desired_length // 4) * (num_freqs // 4)
+        self.fc1 = nn.Linear(self.flat_dim, 64)
+        self.fc2 = nn.Linear(64, 2)  # Binary classification: 2 classes
+
+    def forward(self, x):
+        # x shape: (batch, 1, desired_length, num_freqs)
+        x = self.pool(torch.relu(self.conv1(x)))  # -> (batch, 16, H/2, W/2)
+        x = self.pool(torch.relu(self.conv2(x)))  # -> (batch, 32, H/4, W/4)
+        x = x.view(x.size(0), -1)                 # flatten
+        x = torch.relu(self.fc1(x))
+        x = self.fc2(x)
+        return x
@@ -1,13 +1,20 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from load_dataset import to_ping_time_us, format_ping_time
+from profiling import profiled
 
+@profiled(trace=False)
 def interpolate_ping_time(time_str1: str, time_str2: str, lam: float) -> str:
     """
     Interpolate between two time strings using a linear factor lam.
     Both time_str1 and time_str2 should be in the format '%H:%M:%S.%f'.
     Returns the interpolated time as a string in the same format.
+    If both times are integer microseconds (load_from_path with ping_time_us=True),
+    the interpolated time is returned as integer microseconds instead.
     """
+    if isinstance(time_str1, (int, np.integer)) and isinstance(time_str2, (int, np.integer)):
+        return int(round(time_str1 + lam * (time_str2 - time_str1)))
     t1 = datetime.strptime(time_str1.strip(), '%H:%M:%S.%f')
     t2 = datetime.strptime(time_str2.strip(), '%H:%M:%S.%f')
     seconds1 = t1.hour * 3600 + t1.minute * 60 + t1.second + t1.microsecond / 1e6
@@ -37,6 +44,7 @@ def generate_synthetic_sample(row, neighbor_row, lam: float) -> dict:
                 synthetic_sample[col] = row[col]
     return synthetic_sample
 
+@profiled(trace=False)
 def generate_synthetic_sample_with_noise(row, neighbor_row, lam: float, noise_std: float = 0.01) -> dict:
     """
     Generate one synthetic sample by linearly interpolating between two rows using factor lam,
@@ -64,6 +72,7 @@ def generate_synthetic_sample_with_noise(row, neighbor_row, lam: float, noise_st
                 synthetic_sample[col] = row[col]
     return synthetic_sample
 
+@profiled(trace=False)
 def generate_synthetic_samples_for_class(df, spe_value: str, desired_sample_size: int, noise_std: float = 1):
     """
     Generate synthetic samples for a specified class (Spe) using random interpolation with noise.
@@ -103,4 +112,89 @@ def generate_synthetic_samples_for_class(df, spe_value: str, desired_sample_size
         synthetic_sample = generate_synthetic_sample_with_noise(row1, row2, lam, noise_std)
         synthetic_samples.append(synthetic_sample)
     
+    return pd.DataFrame(synthetic_samples)
+
+@profiled(trace=False)
+def generate_synthetic_samples_for_class_batched(df, spe_value: str, desired_sample_size: int, noise_std: float = 1, rng = None, neighbours = None):
+    """
+    Vectorized version of generate_synthetic_samples_for_class.
+    
+    Rows of the class are grouped by fishNum once, then all fish choices, row pairs,
+    interpolation factors and the (desired_sample_size x num_numeric_cols) noise matrix
+    are drawn in a single pass instead of building the samples one row at a time.
+    
+    Parameters:
+      df: The input DataFrame that has been filtered for relevant classes.
+      spe_value: The value of 'Spe' (e.g., 'LT' or 'SMB') for which to generate synthetic samples.
+      desired_sample_size: The total number of synthetic samples to generate.
+      noise_std: Standard deviation of the Gaussian noise added to numeric features.
+      rng: A np.random.Generator (or a seed for one) used for every random draw.
+      neighbours: An optional neighbours.NeighbourIndex built on df. If given, each sample
+        interpolates towards one of the k nearest neighbours (within the same fish) of the
+        first row instead of a uniformly chosen second row (SMOTE-style).
+    
+    Returns:
+      A DataFrame containing the synthetic samples, with the same columns as
+      generate_synthetic_samples_for_class.
+    """
+    rng = np.random.default_rng(rng)
+    class_df = df[df['Spe'] == spe_value]
+    
+    # Group the rows of each fish together: fish_order lists class_df positions fish by fish,
+    # and fish_starts/fish_counts give the slice of fish_order that belongs to each fish.
+    fish_codes, _ = pd.factorize(class_df['fishNum'])
+    fish_order = np.argsort(fish_codes, kind='stable')
+    fish_counts = np.bincount(fish_codes)
+    fish_starts = np.concatenate(([0], np.cumsum(fish_counts)[:-1]))
+    
+    # Need at least two rows to perform interpolation
+    candidates = np.flatnonzero(fish_counts >= 2)
+    if len(candidates) == 0:
+        print(f"No fish with at least 2 records found for class {spe_value}.")
+        return pd.DataFrame()
+    
+    # Randomly select one fish per sample, then two distinct rows within that fish
+    chosen_fish = candidates[rng.integers(len(candidates), size=desired_sample_size)]
+    group_size = fish_counts[chosen_fish]
+    first = rng.integers(0, group_size)
+    second = rng.integers(0, group_size - 1)
+    second = second + (second >= first)
+    rows1 = fish_order[fish_starts[chosen_fish] + first]
+    rows2 = fish_order[fish_starts[chosen_fish] + second]
+    if neighbours is not None:
+        # Map class_df positions to df positions and back to look up the indexed neighbours
+        if not neighbours.matches(df):
+            raise ValueError("The neighbour index was built on a different DataFrame.")
+        class_positions = np.flatnonzero((df['Spe'] == spe_value).to_numpy())
+        to_class_position = np.full(len(df), -1, dtype=np.int64)
+        to_class_position[class_positions] = np.arange(len(class_positions))
+        rows2 = to_class_position[neighbours.partners(class_positions[rows1], rng)]
+    
+    lam = rng.random(desired_sample_size)  # Random interpolation factors between 0 and 1
+    
+    # Interpolate every numeric column at once and add Gaussian noise
+    numeric_cols = [col for col in class_df.select_dtypes(include=[np.number, bool]).columns
+                    if col not in ['Spe', 'fishNum', 'Ping_time']]
+    values = class_df[numeric_cols].to_numpy(dtype=float)
+    values1 = values[rows1]
+    synthetic_values = values1 + lam[:, None] * (values[rows2] - values1)
+    synthetic_values += rng.normal(0, noise_std, size=synthetic_values.shape)
+    numeric_position = {col: k for k, col in enumerate(numeric_cols)}
+    
+    synthetic_samples = {}
+    for col in class_df.columns:
+        if col == 'Ping_time':
+            # Interpolate in integer microseconds; strings are only formatted for string input
+            ping_us = to_ping_time_us(class_df['Ping_time'])
+            synthetic_us = np.rint(ping_us[rows1] + lam * (ping_us[rows2] - ping_us[rows1])).astype(np.int64)
+            if pd.api.types.is_integer_dtype(class_df['Ping_time']):
+                synthetic_samples[col] = synthetic_us
+            else:
+                synthetic_samples[col] = format_ping_time(synthetic_us, '%H:%M:%S.%f')
+        elif col in numeric_position:
+            synthetic_samples[col] = synthetic_values[:, numeric_position[col]]
+        else:
+            # Categorical columns ('Spe', 'fishNum', ...) are retained from the first row
+            synthetic_samples[col] = class_df[col].to_numpy()[rows1]
+    
     return pd.DataFrame(synthetic_samples)
\ No newline at end of file
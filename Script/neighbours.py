@@ -0,0 +1,127 @@
+"""
+k-nearest-neighbour index over the pings of each fish, for SMOTE-style oversampling.
+
+Instead of interpolating between two uniformly chosen pings of a fish, the synthetic
+generators (module.generate_synthetic_samples_for_class_batched and
+resample.generate_synthetic_samples) can interpolate from a ping towards one of its k
+nearest neighbours within the same fish. Neighbours are computed once on standardized
+frequency vectors with a blocked brute-force distance matrix. Each synthetic sample then
+looks up its partner in O(1). The index can be cached on disk next to the data.
+"""
+import os
+import numpy as np
+import pandas as pd
+from load_dataset import load_from_path, default_cache_dir, frame_fingerprint, frequency_columns
+
+def _fish_neighbours(X, k, block_size):
+    """
+    Returns the (len(X), k) positions of the k nearest other rows of each row of X
+    (-1 where the fish has fewer than k other rows), computed block by block.
+    """
+    n = len(X)
+    neighbours = np.full((n, k), -1, dtype=np.int64)
+    k_fish = min(k, n - 1)
+    if k_fish <= 0:
+        return neighbours
+    squared_norms = (X ** 2).sum(axis=1)
+    for start in range(0, n, block_size):
+        block = slice(start, min(start + block_size, n))
+        distances = squared_norms[block, None] + squared_norms[None, :] - 2 * X[block] @ X.T
+        distances[np.arange(block.stop - start), np.arange(start, block.stop)] = np.inf  # exclude self
+        nearest = np.argpartition(distances, k_fish - 1, axis=1)[:, :k_fish]
+        # Order the k nearest by distance
+        order = np.argsort(np.take_along_axis(distances, nearest, axis=1), axis=1)
+        neighbours[block, :k_fish] = np.take_along_axis(nearest, order, axis=1)
+    return neighbours
+
+class NeighbourIndex:
+    """
+    The k nearest neighbours (within the same fish) of every row of a DataFrame.
+
+    Attributes:
+        neighbours (np.ndarray): (num_rows, k) row positions of each row's neighbours, -1 if missing.
+        counts (np.ndarray): Number of valid neighbours of each row.
+        labels (pd.Index): The DataFrame index the positions refer to.
+        fingerprint (str): frame_fingerprint of the DataFrame the index was built on.
+    """
+    def __init__(self, neighbours, counts, labels, fingerprint = None):
+        self.neighbours = neighbours
+        self.counts = counts
+        self.labels = pd.Index(labels)
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, df, k = 5, block_size = 1024):
+        """
+        Builds the index over the frequency ('F*') columns of df, standardized over the whole
+        frame (missing values count as the mean).
+        """
+        freq_cols = frequency_columns(df.columns)
+        X = df[freq_cols].to_numpy(dtype=np.float64)
+        X = (X - np.nanmean(X, axis=0)) / np.where(np.nanstd(X, axis=0) > 0, np.nanstd(X, axis=0), 1.0)
+        X = np.nan_to_num(X)
+
+        neighbours = np.full((len(df), k), -1, dtype=np.int64)
+        fish_codes, _ = pd.factorize(df['fishNum'])
+        for code in range(fish_codes.max() + 1 if len(df) else 0):
+            positions = np.flatnonzero(fish_codes == code)
+            fish_neighbours = _fish_neighbours(X[positions], k, block_size)
+            neighbours[positions] = np.where(fish_neighbours >= 0, positions[np.maximum(fish_neighbours, 0)], -1)
+        counts = (neighbours >= 0).sum(axis=1)
+        return cls(neighbours, counts, df.index, frame_fingerprint(df, ['fishNum'] + freq_cols))
+
+    def matches(self, df):
+        """
+        Returns whether the index was built on df: the same row labels in the same order and,
+        if the index has a fingerprint, the same fish and frequency values.
+        """
+        if len(self.labels) != len(df) or not self.labels.equals(df.index):
+            return False
+        if self.fingerprint is None:
+            return True
+        return self.fingerprint == frame_fingerprint(df, ['fishNum'] + frequency_columns(df.columns))
+
+    def partners(self, positions, rng):
+        """
+        Returns one uniformly chosen neighbour (row position) for each row position, or -1
+        for rows without neighbours.
+        """
+        positions = np.asarray(positions)
+        counts = self.counts[positions]
+        choice = rng.integers(0, np.maximum(counts, 1))
+        return np.where(counts > 0, self.neighbours[positions, choice], -1)
+
+    def partner_of_label(self, label, rng):
+        """
+        Returns the index label of a random neighbour of the row with the given index label.
+        """
+        partner = self.partners([self.labels.get_loc(label)], rng)[0]
+        return self.labels[partner] if partner >= 0 else None
+
+    def save(self, path):
+        np.savez(path, neighbours=self.neighbours, counts=self.counts, labels=self.labels.to_numpy(),
+                 fingerprint=np.array(self.fingerprint or ''))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['neighbours'], data['counts'], data['labels'], str(data['fingerprint']) or None)
+
+def neighbour_index_from_path(data_path, target_classes = [], exclude_individuals = [], k = 5, use_cache = True):
+    """
+    Loads a dataset with load_from_path and returns (df, NeighbourIndex). The index is cached
+    in the data file's cache folder (see load_dataset.default_cache_dir) and rebuilt whenever
+    the loaded frame changes.
+    """
+    df = load_from_path(data_path, target_classes, exclude_individuals)
+    fingerprint = frame_fingerprint(df, ['fishNum'] + frequency_columns(df.columns))
+    cache_path = os.path.join(default_cache_dir(data_path), f'neighbours_k{k}_{fingerprint[:16]}.npz')
+    if use_cache and os.path.exists(cache_path):
+        index = NeighbourIndex.load(cache_path)
+        if index.fingerprint == fingerprint:
+            return df, index
+    index = NeighbourIndex.build(df, k)
+    if use_cache:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        index.save(cache_path)
+    return df, index
@@ -0,0 +1,132 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import torch
+from threadpoolctl import threadpool_limits
+from joblib import parallel_config
+from sklearn.model_selection import cross_val_score
+from trainer import train_model, evaluate_accuracy, average_models
+from profiling import stage, record_throughput
+
+def threads_per_worker(n_jobs):
+    """
+    Returns how many torch/BLAS threads each of n_jobs workers may use without oversubscribing the machine.
+    """
+    return max(1, (os.cpu_count() or 1) // n_jobs)
+
+# State shared by the tasks of a worker process, set once by _init_worker
+_worker = {}
+
+def _init_worker(num_threads, model_fn, X, Y, train_kwargs):
+    # Limit torch and BLAS threads in this worker so that the folds do not oversubscribe the CPU
+    torch.set_num_threads(num_threads)
+    _worker['limits'] = threadpool_limits(limits=num_threads)
+    _worker.update(model_fn=model_fn, X=X, Y=Y, train_kwargs=train_kwargs)
+
+def _run_fold(fold_seed, train_index, val_index):
+    # Also returns the samples trained on (training rows times epochs run) and the training
+    # time, for the throughput records of the parent process
+    X, Y = _worker['X'], _worker['Y']
+    torch.manual_seed(fold_seed)
+    model = _worker['model_fn']()
+    start = time.perf_counter()
+    if val_index is None:
+        # Final model on the entire dataset: no validation
+        kwargs = {key: value for key, value in _worker['train_kwargs'].items() if key not in ('val_every', 'patience')}
+        train_model(model, X, Y, **kwargs)
+        return model.state_dict(), None, None, None, len(X) * kwargs['num_epochs'], time.perf_counter() - start
+    X_val, Y_val = X[val_index], Y[val_index]
+    train_losses, val_losses = train_model(model, X[train_index], Y[train_index], X_val, Y_val, **_worker['train_kwargs'])
+    seconds = time.perf_counter() - start
+    return (model.state_dict(), train_losses, val_losses, evaluate_accuracy(model, X_val, Y_val),
+            len(train_index) * len(train_losses), seconds)
+
+def train_and_evaluate_model_parallel(model_fn, X, Y, kf, num_epochs = 100, lr = 0.001, l1_lambda = 0, device = torch.device("cpu"),
+                                      batch_size = None, val_every = 1, patience = None, seed = 0, train_final = True,
+                                      n_jobs = -1, num_threads = None):
+    """
+    Fold-parallel version of trainer.train_and_evaluate_model for CPU nodes.
+
+    Every fold (and the final model on the entire dataset) is trained in its own worker
+    process, with torch and BLAS limited to num_threads threads per worker. Fold i is seeded
+    with seed + i exactly like train_and_evaluate_model(..., seed=seed), so both return the
+    same fold accuracies, loss curves and averaged model.
+
+    model_fn, X and Y are handed to each worker once through the pool initializer. Workers
+    train on the CPU; the returned models are moved to 'device'.
+
+    Parameters:
+        model_fn, X, Y, kf, num_epochs, lr, l1_lambda, batch_size, val_every, patience, train_final:
+            As in trainer.train_and_evaluate_model. kf may be a KFold or StratifiedKFold.
+        device (torch.device): Device on which to place the returned models.
+        seed (int): Base seed; fold i uses seed + i.
+        n_jobs (int): Number of worker processes (-1 for one per fold).
+        num_threads (int, optional): Threads per worker (default: CPU count divided by n_jobs).
+
+    Returns:
+        fold_accuracies, all_fold_train_losses, all_fold_val_losses, average_model, final_model
+        as in trainer.train_and_evaluate_model.
+    """
+    X, Y = X.cpu(), Y.cpu()
+    folds = list(kf.split(X, Y))
+    tasks = [(seed + i, train_index, val_index) for i, (train_index, val_index) in enumerate(folds)]
+    if train_final:
+        tasks.append((seed + len(folds), None, None))
+
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = len(tasks)
+    n_jobs = min(n_jobs, len(tasks))
+    num_threads = num_threads or threads_per_worker(n_jobs)
+    train_kwargs = dict(num_epochs=num_epochs, lr=lr, l1_lambda=l1_lambda, batch_size=batch_size,
+                        val_every=val_every, patience=patience)
+
+    with stage('parallel_cv.train_folds', n_jobs=n_jobs, num_threads=num_threads):
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(num_threads, model_fn, X, Y, train_kwargs)) as executor:
+            futures = [executor.submit(_run_fold, *task) for task in tasks]
+            results = [future.result() for future in futures]
+
+    # Samples/sec of every fold in its worker, see profiling.py
+    for k, (*_, samples, seconds) in enumerate(results):
+        record_throughput('trainer.train_fold', samples, seconds,
+                          fold=k + 1 if k < len(folds) else 'final', parallel=True)
+
+    fold_accuracies = []
+    all_fold_train_losses = []
+    all_fold_val_losses = []
+    fold_models = []
+    for fold_num, (state_dict, train_losses, val_losses, acc, _, _) in enumerate(results[:len(folds)], start=1):
+        model = model_fn().to(device)
+        model.load_state_dict(state_dict)
+        fold_models.append(model)
+        fold_accuracies.append(acc)
+        all_fold_train_losses.append(train_losses)
+        all_fold_val_losses.append(val_losses)
+        print(f"Fold {fold_num} Accuracy: {acc:.4f}")
+
+    print("\nMean CV Accuracy: {:.4f}".format(np.mean(fold_accuracies)))
+
+    # Average the parameters from the fold models.
+    average_model = average_models(fold_models, model_fn, device)
+
+    final_model = None
+    if train_final:
+        final_model = model_fn().to(device)
+        final_model.load_state_dict(results[-1][0])
+
+    return fold_accuracies, all_fold_train_losses, all_fold_val_losses, average_model, final_model
+
+def cross_val_score_parallel(estimator, X, y, cv, n_jobs = -1, num_threads = None, scoring = 'accuracy'):
+    """
+    cross_val_score with one fold per worker process and the BLAS/OpenMP threads of each
+    worker limited to num_threads (default: CPU count divided by the number of workers),
+    for the scikit-learn RandomForest / MLPClassifier baselines.
+    """
+    n_splits = cv.get_n_splits(X, y)
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = n_splits
+    n_jobs = min(n_jobs, n_splits)
+    num_threads = num_threads or threads_per_worker(n_jobs)
+    with parallel_config(backend='loky', inner_max_num_threads=num_threads):
+        return cross_val_score(estimator, X, y, cv=cv, scoring=scoring, n_jobs=n_jobs)
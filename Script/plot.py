@@ -2,7 +2,17 @@ import matplotlib.pyplot as plt
 import numpy as np
 import torch
 
-def plot_feature_importance(df, title = 'Feature Importance Plot', cap = 3):
+def _show_or_save(fig, path = None):
+    """
+    Shows the figure, or saves it to path and closes it (for headless batch runs).
+    """
+    if path is None:
+        plt.show()
+    else:
+        fig.savefig(path)
+        plt.close(fig)
+
+def plot_feature_importance(df, title = 'Feature Importance Plot', cap = 3, path = None):
     """
     Plots feature importance values in a line plot from the given DataFrame.
     
@@ -12,12 +22,12 @@ def plot_feature_importance(df, title = 'Feature Importance Plot', cap = 3):
             'Importance' : the calculated importance values for each feature.
             
     The x-axis will show the feature names and the y-axis will show their importance.
-    The plot is displayed using matplotlib.
+    The plot is displayed using matplotlib, or saved to path if given.
     """
     # Ensure the DataFrame is sorted by importance (optional)
     df = df.sort_values(by='Importance', ascending=False)
     
-    plt.figure(figsize=(12, 3))
+    fig = plt.figure(figsize=(12, 3))
     plt.plot(df['Feature'], df['Importance'], marker='o', linestyle='-')
     # plt.xticks(rotation=90)
     plt.xticks([])       
@@ -26,9 +36,9 @@ def plot_feature_importance(df, title = 'Feature Importance Plot', cap = 3):
     plt.ylabel('Importance')
     plt.title(title)
     plt.tight_layout()
-    plt.show()
+    _show_or_save(fig, path)
 
-def plot_spectrogram(spec, title="Spectrogram", cmap='viridis'):
+def plot_spectrogram(spec, title="Spectrogram", cmap='viridis', path = None):
     """
     Plots a single spectrogram.
     
@@ -38,6 +48,7 @@ def plot_spectrogram(spec, title="Spectrogram", cmap='viridis'):
             - A 3D array with one channel, e.g., (1, height, width) or (height, width, 1).
         title (str, optional): The title of the plot.
         cmap (str, optional): The matplotlib colormap to use (default is 'viridis').
+        path (str, optional): Save the plot to this file instead of showing it.
     """
     # If the input is a torch.Tensor, convert it to a numpy array.
     if isinstance(spec, torch.Tensor):
@@ -55,7 +66,7 @@ def plot_spectrogram(spec, title="Spectrogram", cmap='viridis'):
             # Otherwise, default to using the first channel.
             spec = spec[0]
     
-    plt.figure(figsize=(12, 4))
+    fig = plt.figure(figsize=(12, 4))
     plt.imshow(spec, aspect='auto', origin='lower', cmap=cmap)
     if title is not None:
         plt.title(title)
@@ -63,10 +74,10 @@ def plot_spectrogram(spec, title="Spectrogram", cmap='viridis'):
     plt.xlabel("Normalized Time Steps")
     plt.ylabel("Frequency Bins")
     plt.xticks([])  # Remove X-axis ticks for a neater look.
-    plt.show()
+    _show_or_save(fig, path)
 
 
-def plot_learning_curve(ax, train_losses, val_losses, fold_number):
+def plot_learning_curve(ax, train_losses, val_losses, fold_number, val_every = 1):
     """
     Plots the learning curve (train and validation losses) for a given fold
     on the provided axes instance 'ax' and removes X-axis ticks.
@@ -74,30 +85,54 @@ def plot_learning_curve(ax, train_losses, val_losses, fold_number):
     Parameters:
         ax (matplotlib.axes.Axes): The axes to plot on.
         train_losses (list or array): The training losses per epoch.
-        val_losses (list or array): The validation losses per epoch.
+        val_losses (list or array): The validation losses, one every 'val_every' epochs.
         fold_number (int): The fold number (for titling the plot).
+        val_every (int, optional): Number of epochs between validation losses (default is 1).
     """
     epochs = len(train_losses)
     x = range(1, epochs + 1)
     ax.plot(x, train_losses, label="Train Loss")
-    ax.plot(x, val_losses, label="Validation Loss")
+    ax.plot(range(val_every, val_every * len(val_losses) + 1, val_every), val_losses, label="Validation Loss")
     ax.set_title(f'Fold {fold_number}')
     ax.set_xlabel('Epoch')
     ax.set_ylabel('Loss')
     ax.set_xticks([])
     ax.legend()
 
-def plot_fold_accuracies(fold_accuracies, title = 'Final Accuracies for Each Fold'):
+def plot_learning_curves(all_fold_train_losses, all_fold_val_losses, val_every = 1, ncols = 3, path = None):
+    """
+    Plots the learning curve of every fold in a grid (as in the notebooks), using plot_learning_curve.
+
+    Parameters:
+        all_fold_train_losses (list): Training losses of each fold.
+        all_fold_val_losses (list): Validation losses of each fold.
+        val_every (int, optional): Number of epochs between validation losses (default is 1).
+        ncols (int, optional): Number of plots per row.
+        path (str, optional): Save the figure to this file instead of showing it.
+    """
+    num_folds = len(all_fold_train_losses)
+    nrows = -(-num_folds // ncols)
+    fig, axes = plt.subplots(nrows, ncols, figsize=(4 * ncols, 3 * nrows), sharey=True, squeeze=False)
+    axes = axes.ravel()
+    for fold in range(num_folds):
+        plot_learning_curve(axes[fold], all_fold_train_losses[fold], all_fold_val_losses[fold], fold + 1, val_every)
+    for ax in axes[num_folds:]:
+        ax.axis('off')
+    plt.tight_layout()
+    _show_or_save(fig, path)
+
+def plot_fold_accuracies(fold_accuracies, title = 'Final Accuracies for Each Fold', path = None):
     """
     Plots a bar chart of final accuracies for each fold.
 
     Parameters:
         fold_accuracies (list or array): A list/array of final accuracies for each fold.
+        path (str, optional): Save the plot to this file instead of showing it.
     """
     fold_numbers = np.arange(1, len(fold_accuracies) + 1)
     avg_accuracy = np.mean(fold_accuracies)
 
-    plt.figure(figsize=(10, 4))
+    fig = plt.figure(figsize=(10, 4))
     bars = plt.bar(fold_numbers, fold_accuracies, color='skyblue', edgecolor='k')
 
     # Optional: add text labels above each bar with the accuracy values.
@@ -115,4 +150,84 @@ def plot_fold_accuracies(fold_accuracies, title = 'Final Accuracies for Each Fol
     plt.ylim(0, 1)
     plt.legend()
     plt.tight_layout()
-    plt.show()
\ No newline at end of file
+    _show_or_save(fig, path)
+
+def plot_response_by_group(summary, title = 'Sonar Response vs Frequency by Species', band = True, path = None):
+    """
+    Plots the mean response against frequency for each group, as markers without lines so
+    that the frequency gap stays visible, with a +/- one standard deviation band.
+
+    Parameters:
+        summary (pd.DataFrame): Columns group, frequency, mean and std, e.g. from
+            running_stats.FrequencyStatistics.response_by_group.
+        title (str, optional): The title of the plot.
+        band (bool, optional): Whether to shade the standard deviation band.
+        path (str, optional): Save the plot to this file instead of showing it.
+    """
+    fig = plt.figure(figsize=(10, 4))
+    for group, rows in summary.groupby('group', sort=False, observed=True):
+        points = plt.plot(rows['frequency'], rows['mean'], marker='o', linestyle='None', markersize=3, label=str(group))
+        if band:
+            # Split the band at the frequency gap
+            segment = np.cumsum(np.diff(rows['frequency'].to_numpy(), prepend=rows['frequency'].iloc[0]) > 1)
+            for _, part in rows.groupby(segment):
+                plt.fill_between(part['frequency'], part['mean'] - part['std'], part['mean'] + part['std'],
+                                 color=points[0].get_color(), alpha=0.2)
+    plt.xlabel("Frequency (Hz)")
+    plt.ylabel("Response Value")
+    plt.title(title)
+    plt.grid(True)
+    plt.legend(title="Species")
+    plt.tight_layout()
+    _show_or_save(fig, path)
+
+def plot_ping_series(series, title = 'Frequency Response Over Pings', path = None):
+    """
+    Plots the response of a few frequencies of one fish over its pings.
+
+    Parameters:
+        series (pd.DataFrame): One column per frequency, indexed by ping time, e.g. from
+            running_stats.FrequencyStatistics.ping_series.
+        title (str, optional): The title of the plot.
+        path (str, optional): Save the plot to this file instead of showing it.
+    """
+    linestyles = ['-', '--', '-.', ':']
+    fig, ax = plt.subplots(figsize=(12, 4))
+    for i, col in enumerate(series.columns):
+        ax.plot(series.index, series[col], label=col, linestyle=linestyles[i % len(linestyles)])
+    ax.set_xlabel("Ping Number")
+    ax.set_ylabel("Response Value")
+    ax.set_title(title)
+    ax.legend(title="Frequency")
+    ax.set_xticklabels([])
+    plt.tight_layout()
+    _show_or_save(fig, path)
+
+def plot_correlation_heatmap(corr, title = 'Correlation Heatmap', annot = None, path = None):
+    """
+    Plots a correlation matrix as a heatmap.
+
+    Parameters:
+        corr (pd.DataFrame): A square correlation matrix, e.g. from
+            running_stats.FrequencyStatistics.correlation.
+        title (str, optional): The title of the plot.
+        annot (bool, optional): Write the coefficients in the cells (default: only for up to 20 columns).
+        path (str, optional): Save the plot to this file instead of showing it.
+    """
+    size = len(corr)
+    annot = size <= 20 if annot is None else annot
+    fig, ax = plt.subplots(figsize=(10, 4) if size <= 20 else (10, 8))
+    image = ax.imshow(corr.to_numpy(), cmap='coolwarm', vmin=-1, vmax=1, aspect='auto')
+    fig.colorbar(image, ax=ax)
+    ticks = np.arange(size) if size <= 20 else np.linspace(0, size - 1, 20).astype(int)
+    ax.set_xticks(ticks)
+    ax.set_xticklabels(corr.columns[ticks], rotation=90)
+    ax.set_yticks(ticks)
+    ax.set_yticklabels(corr.index[ticks])
+    if annot:
+        for i in range(size):
+            for j in range(size):
+                ax.text(j, i, f'{corr.iat[i, j]:.2f}', ha='center', va='center', fontsize=8)
+    ax.set_title(title)
+    plt.tight_layout()
+    _show_or_save(fig, path)
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+Opt-in profiling of the data pipeline: stage timers, call counters, memory high-water marks
+and training throughput.
+
+Profiling is off by default. The instrumented functions in load_dataset, module, resample,
+spectrogram and trainer then only check one global before running. Turn it on either
+  - for a whole run, with the environment variable STA2453_PROFILE=1 (the summary table is
+    printed at exit, and a Chrome trace written if STA2453_PROFILE_TRACE=<path> is set), or
+  - for a block of code, with the profiling() context manager:
+
+    with profiling(trace_path='trace.json') as profiler:
+        df = load_from_path(path)
+        ...
+    print(profiler.summary_table())
+
+The trace can be opened in chrome://tracing or https://ui.perfetto.dev. Helpers called once
+per row or per sample are decorated with @profiled(trace=False): their calls are only
+aggregated in the summary table, so the trace stays small. At most max_events trace events
+are kept; the rest are counted as 'profiling.dropped_events'.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process in MB, or None if unknown.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+class Profiler:
+    """
+    Collects stage timings, counters and throughput records.
+
+    Attributes:
+        stages (dict): name -> {'calls', 'seconds', 'max_seconds', 'peak_rss_mb'}.
+        counters (dict): name -> count.
+        throughput (list): Records of {'name', 'samples', 'seconds', 'samples_per_second', ...}.
+        events (list): Chrome trace events, at most max_events of them.
+    """
+    def __init__(self, max_events = 1000000):
+        self.max_events = max_events
+        self.stages = {}
+        self.counters = {}
+        self.throughput = []
+        self.events = []
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _now_us(self):
+        return (time.perf_counter() - self.start) * 1e6
+
+    def _add_event(self, event):
+        # Called with the lock held
+        if len(self.events) < self.max_events:
+            self.events.append(event)
+        else:
+            self.counters['profiling.dropped_events'] = self.counters.get('profiling.dropped_events', 0) + 1
+
+    @contextmanager
+    def stage(self, name, trace = True, **args):
+        """
+        Times a block of code as one call of the stage name. With trace False the call is
+        only added to the stage totals, without a trace event.
+        """
+        start = time.perf_counter()
+        start_us = self._now_us()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            rss = peak_rss_mb()
+            with self._lock:
+                stats = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'peak_rss_mb': None})
+                stats['calls'] += 1
+                stats['seconds'] += seconds
+                stats['max_seconds'] = max(stats['max_seconds'], seconds)
+                if rss is not None:
+                    stats['peak_rss_mb'] = max(stats['peak_rss_mb'] or 0.0, rss)
+                if trace:
+                    self._add_event({'name': name, 'ph': 'X', 'ts': start_us, 'dur': seconds * 1e6,
+                                     'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args})
+
+    def count(self, name, n = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_throughput(self, name, samples, seconds, **args):
+        """
+        Records that samples were processed in seconds (e.g. per training fold).
+        """
+        record = {'name': name, 'samples': samples, 'seconds': seconds,
+                  'samples_per_second': samples / seconds if seconds > 0 else None, **args}
+        with self._lock:
+            self.throughput.append(record)
+            self._add_event({'name': name, 'ph': 'C', 'ts': self._now_us(), 'pid': os.getpid(),
+                             'args': {'samples_per_second': record['samples_per_second'] or 0.0}})
+
+    def summary_table(self):
+        """
+        Returns the per-stage summary (sorted by total time), counters and throughput as text.
+        """
+        wall = time.perf_counter() - self.start
+        lines = [f"{'stage':<56} {'calls':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10} {'% wall':>7} {'peak MB':>9}"]
+        for name, stats in sorted(self.stages.items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"{name:<56} {stats['calls']:>8} {stats['seconds']:>10.3f} "
+                         f"{1e3 * stats['seconds'] / stats['calls']:>10.3f} {1e3 * stats['max_seconds']:>10.3f} "
+                         f"{100 * stats['seconds'] / wall if wall > 0 else 0:>7.1f} {stats['peak_rss_mb'] or 0:>9.1f}")
+        for name, count in sorted(self.counters.items()):
+            lines.append(f"counter {name}: {count}")
+        for record in self.throughput:
+            extra = ' '.join(f'{key}={value}' for key, value in record.items()
+                             if key not in ('name', 'samples', 'seconds', 'samples_per_second'))
+            lines.append(f"{record['name']} {extra}: {record['samples']} samples in {record['seconds']:.3f}s "
+                         f"({record['samples_per_second'] or 0:.1f} samples/s)")
+        return '\n'.join(lines)
+
+    def write_chrome_trace(self, path):
+        """
+        Writes the recorded stages and throughput counters as a Chrome trace JSON file.
+        """
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+# The active profiler, or None when profiling is off
+_active = None
+
+def active_profiler():
+    return _active
+
+@contextmanager
+def profiling(trace_path = None, print_summary = False):
+    """
+    Profiles the enclosed block with a fresh Profiler (yielded), restoring the previous
+    state afterwards. Optionally writes a Chrome trace and prints the summary table.
+    """
+    global _active
+    previous, _active = _active, Profiler()
+    profiler = _active
+    try:
+        yield profiler
+    finally:
+        _active = previous
+        if trace_path is not None:
+            profiler.write_chrome_trace(trace_path)
+        if print_summary:
+            print(profiler.summary_table())
+
+def stage(name, **args):
+    """
+    Context manager timing a block as a stage; does nothing when profiling is off.
+    """
+    return _active.stage(name, **args) if _active is not None else nullcontext()
+
+def count(name, n = 1):
+    if _active is not None:
+        _active.count(name, n)
+
+def record_throughput(name, samples, seconds, **args):
+    if _active is not None:
+        _active.record_throughput(name, samples, seconds, **args)
+
+def profiled(name = None, trace = True):
+    """
+    Decorator timing every call of a function as a stage (named module.function by default).
+    Use trace=False for functions called per row or per sample, so their calls are only
+    aggregated (calls, total and max time) instead of each adding a trace event.
+    """
+    def decorate(fn):
+        label = name or f'{fn.__module__}.{fn.__qualname__}'
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return fn(*args, **kwargs)
+            with _active.stage(label, trace=trace):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def _report_at_exit(profiler, trace_path):
+    print(profiler.summary_table(), file=sys.stderr)
+    if trace_path:
+        profiler.write_chrome_trace(trace_path)
+
+if os.environ.get('STA2453_PROFILE', '') not in ('', '0'):
+    _active = Profiler()
+    atexit.register(_report_at_exit, _active, os.environ.get('STA2453_PROFILE_TRACE'))
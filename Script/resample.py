@@ -1,8 +1,12 @@
+import os
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from load_dataset import load_from_path
+from profiling import profiled
 
+@profiled(trace=False)
 def average_time_str(t1, t2):
     """
     Averages two time strings in the format '%H:%M:%S.%f' by computing the midpoint.
@@ -28,21 +32,32 @@ def average_time_str(t1, t2):
     new_dt = datetime(1900, 1, 1, hour=hours, minute=minutes, second=sec_int, microsecond=microsec)
     return new_dt.strftime("%H:%M:%S.%f")
 
-def generate_synthetic_sample_for_group(group, numeric_cols, noise_std = 1, init_stat = 0):
+@profiled(trace=False)
+def generate_synthetic_sample_for_group(group, numeric_cols, noise_std = 1, init_stat = 0, rng = None, neighbours = None):
     """
     Generates one synthetic sample from the provided group:
       - Randomly selects two rows from the group.
       - Averages numeric columns and adds Gaussian noise.
-      - Averages the 'Ping_time' column (computes midpoint).
+      - Averages the 'Ping_time' column (computes midpoint), as a string or as integer
+        microseconds depending on how it was loaded.
       - Retains other non-numeric columns from the first sampled row.
+    If rng (a np.random.Generator) is given, it is used for every random draw instead of
+    init_stat and the global seed.
+    If neighbours (a neighbours.NeighbourIndex built on the full DataFrame) is given, the
+    second row is one of the k nearest neighbours of the first instead of a random row.
     Returns the synthetic sample as a dictionary.
     """
-    # Randomly select 2 rows (the global seed ensures reproducibility)
-    sampled = group.sample(n=2, random_state = init_stat)
+    if neighbours is None:
+        # Randomly select 2 rows (the global seed ensures reproducibility)
+        sampled = group.sample(n=2, random_state = init_stat if rng is None else rng)
+    else:
+        first = group.sample(n=1, random_state = init_stat if rng is None else rng).index[0]
+        partner = neighbours.partner_of_label(first, np.random.default_rng(init_stat) if rng is None else rng)
+        sampled = group.loc[[first, partner]]
     
     # Average numeric columns and add Gaussian noise
     avg_numeric = sampled[numeric_cols].mean()
-    noise = np.random.normal(loc=0.0, scale=noise_std, size=avg_numeric.shape)
+    noise = (np.random if rng is None else rng).normal(loc=0.0, scale=noise_std, size=avg_numeric.shape)
     avg_numeric_noisy = avg_numeric + noise
     
     synthetic_sample = {}
@@ -52,7 +67,10 @@ def generate_synthetic_sample_for_group(group, numeric_cols, noise_std = 1, init
         elif col == 'Ping_time':
             t1 = sampled.iloc[0]['Ping_time']
             t2 = sampled.iloc[1]['Ping_time']
-            synthetic_sample[col] = average_time_str(t1, t2)
+            if isinstance(t1, str):
+                synthetic_sample[col] = average_time_str(t1, t2)
+            else:
+                synthetic_sample[col] = int(round((t1 + t2) / 2))
         else:
             # Retain non-numeric columns from the first sampled row
             synthetic_sample[col] = sampled.iloc[0][col]
@@ -60,12 +78,16 @@ def generate_synthetic_sample_for_group(group, numeric_cols, noise_std = 1, init
     # synthetic_sample['isSynthetic'] = True
     return synthetic_sample
 
-def generate_synthetic_samples(df, target_class, num_samples, noise_std = 1, init_stat = 0):
+@profiled()
+def generate_synthetic_samples(df, target_class, num_samples, noise_std = 1, init_stat = 0, rng = None, neighbours = None):
     """
     Generates a specified number of synthetic samples for the target class.
       - Filters the dataframe for the target class.
       - Groups data by 'fishNum' (only groups with at least 2 records are used).
       - Randomly picks a group (with replacement) and generates a synthetic sample.
+    If rng (a np.random.Generator) is given, it drives every random draw.
+    If neighbours (a neighbours.NeighbourIndex built on df) is given, each sample interpolates
+    between a row and one of its nearest neighbours (see generate_synthetic_sample_for_group).
     Returns a DataFrame with the synthetic samples.
     """
     df_class = df[df['Spe'] == target_class]
@@ -76,68 +98,97 @@ def generate_synthetic_samples(df, target_class, num_samples, noise_std = 1, ini
         print(f"No groups with at least 2 records found for class {target_class}.")
         return pd.DataFrame()
     
-    # Identify numeric columns (used for averaging)
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+    # Identify numeric columns (used for averaging); an integer Ping_time is averaged separately
+    numeric_cols = [col for col in df.select_dtypes(include=[np.number]).columns if col != 'Ping_time']
     
     synthetic_samples = []
     for _ in range(num_samples):
         # Randomly select one group (with replacement)
-        group = groups[np.random.randint(len(groups))]
-        synthetic_sample = generate_synthetic_sample_for_group(group, numeric_cols, noise_std = noise_std, init_stat = init_stat)
+        group = groups[np.random.randint(len(groups)) if rng is None else rng.integers(len(groups))]
+        synthetic_sample = generate_synthetic_sample_for_group(group, numeric_cols, noise_std = noise_std, init_stat = init_stat, rng = rng, neighbours = neighbours)
         init_stat = init_stat + 1
         synthetic_samples.append(synthetic_sample)
     
     return pd.DataFrame(synthetic_samples)
 
-def generate_synthetic_dataset_from_path(data_path, samples_size = 20000, noise_std = 1, init_stat = 0):
+def generate_synthetic_dataset_from_path(data_path, samples_size = 20000, noise_std = 1, init_stat = 0, n_jobs = 1):
     """
     Generates a complete synthetic dataset from a file path.
       - Load dataset from given path
       - For each speices generate synthetic samples of chosen samples size.
       - Append samples of each speices to a DataFrame
+    See generate_synthetic_dataset_from_dataFrame for n_jobs.
     Returns the DataFrame containing all the synthetic samples.
     """
     df = load_from_path(data_path)
+    return generate_synthetic_dataset_from_dataFrame(df, samples_size = samples_size, noise_std = noise_std, init_stat = init_stat, n_jobs = n_jobs)
 
+@profiled()
+def generate_synthetic_dataset_from_dataFrame(df, samples_size = 20000, noise_std = 1, init_stat = 0, n_jobs = 1):
+    """
+    Generates a complete synthetic dataset from a loaded dataframe.
+      - For each speices generate synthetic samples of chosen samples size.
+      - Append samples of each speices to a DataFrame
+    With n_jobs > 1 (or -1 for all cores) the samples are generated in parallel, see
+    generate_synthetic_samples_parallel.
+    Returns the DataFrame containing all the synthetic samples.
+    """
     samples_per_class = {
         'LT': samples_size,   # synthetic samples for class 'LT'
         'SMB': samples_size   # synthetic samples for class 'SMB'
     }
 
-    synthetic_samples_all = []
-    for target_class, num_samples in samples_per_class.items():
-        synthetic_df = generate_synthetic_samples(df, target_class, num_samples, noise_std = noise_std, init_stat = init_stat)
-        synthetic_samples_all.append(synthetic_df)
+    if n_jobs != 1:
+        all_synthetic_df = generate_synthetic_samples_parallel(df, samples_per_class, noise_std = noise_std, init_stat = init_stat, n_jobs = n_jobs)
+    else:
+        synthetic_samples_all = []
+        for target_class, num_samples in samples_per_class.items():
+            synthetic_df = generate_synthetic_samples(df, target_class, num_samples, noise_std = noise_std, init_stat = init_stat)
+            synthetic_samples_all.append(synthetic_df)
 
-    # Combine synthetic samples from all classes
-    all_synthetic_df = pd.concat(synthetic_samples_all, ignore_index=True)
+        # Combine synthetic samples from all classes
+        all_synthetic_df = pd.concat(synthetic_samples_all, ignore_index=True)
 
     # Combine synthetic samples with the original data to create an augmented dataset
     augmented_df = pd.concat([df, all_synthetic_df], ignore_index=True)
 
     return augmented_df
 
-def generate_synthetic_dataset_from_dataFrame(df, samples_size = 20000, noise_std = 1, init_stat = 0):
+# DataFrame shared by the tasks of a worker process, set once by _init_worker
+_worker_df = None
+
+def _init_worker(df):
+    global _worker_df
+    _worker_df = df
+
+def _generate_chunk(target_class, num_samples, noise_std, seed):
+    return generate_synthetic_samples(_worker_df, target_class, num_samples, noise_std = noise_std, rng = np.random.default_rng(seed))
+
+@profiled()
+def generate_synthetic_samples_parallel(df, samples_per_class, noise_std = 1, init_stat = 0, n_jobs = -1):
     """
-    Generates a complete synthetic dataset from a loaded dataframe.
-      - For each speices generate synthetic samples of chosen samples size.
-      - Append samples of each speices to a DataFrame
-    Returns the DataFrame containing all the synthetic samples.
+    Generates synthetic samples for several classes on a process pool.
+      - Splits each class's samples into n_jobs chunks.
+      - Gives every chunk its own RNG stream, spawned from np.random.SeedSequence(init_stat).
+      - Sends df to each worker once (pool initializer) instead of with every task.
+      - Concatenates the chunks in class and chunk order.
+    The result is deterministic for a given init_stat and n_jobs, but differs from the
+    sequential generate_synthetic_samples, which uses the global seed.
+    Returns a DataFrame with the synthetic samples of all classes.
     """
-    samples_per_class = {
-        'LT': samples_size,   # synthetic samples for class 'LT'
-        'SMB': samples_size   # synthetic samples for class 'SMB'
-    }
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count()
 
-    synthetic_samples_all = []
+    tasks = []
     for target_class, num_samples in samples_per_class.items():
-        synthetic_df = generate_synthetic_samples(df, target_class, num_samples, noise_std = noise_std, init_stat = init_stat)
-        synthetic_samples_all.append(synthetic_df)
+        for chunk in np.array_split(np.arange(num_samples), n_jobs):
+            if len(chunk):
+                tasks.append((target_class, len(chunk)))
+    seeds = np.random.SeedSequence(init_stat).spawn(len(tasks))
 
-    # Combine synthetic samples from all classes
-    all_synthetic_df = pd.concat(synthetic_samples_all, ignore_index=True)
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(df,)) as executor:
+        futures = [executor.submit(_generate_chunk, target_class, num_samples, noise_std, seed)
+                   for (target_class, num_samples), seed in zip(tasks, seeds)]
+        chunks = [future.result() for future in futures]
 
-    # Combine synthetic samples with the original data to create an augmented dataset
-    augmented_df = pd.concat([df, all_synthetic_df], ignore_index=True)
-
-    return augmented_df
+    return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,368 @@
+"""
+One-pass, chunked statistics of the full dataset for the EDA plots of '1. EDA.ipynb'.
+
+Instead of loading the whole file (or a sample_dataset.py sample) into memory, the dataset
+is read in chunks with load_dataset.load_chunks, and every chunk updates running statistics:
+  - count, mean, variance (Welford / Chan et al. updates), min and max of each frequency
+    column, per species, per fish and overall (GroupedStats),
+  - the same for a few tracked frequencies per fish and Ping_time bin, for the frequency
+    response over pings,
+  - a pairwise-complete covariance matrix of the frequency columns, for the correlation
+    heatmap (PairwiseCovariance; NaNs are handled like DataFrame.corr).
+All of them merge exactly, so chunks can be summarized in worker processes and combined
+afterwards in any order.
+
+The results are DataFrames in the shapes plot.py expects (plot_response_by_group,
+plot_ping_series, plot_correlation_heatmap).
+
+Example:
+    stats = compute_statistics('../Data/sample_data.csv', chunksize = 50000, n_jobs = 4)
+    plot_response_by_group(stats.response_by_group('species'), 'Sonar Response vs Frequency by Species')
+    plot_correlation_heatmap(stats.correlation(['F45', 'F89.5', 'F175', 'F260']))
+"""
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import joblib
+from load_dataset import load_chunks, to_ping_time_us, frequency_columns
+from profiling import profiled, count
+
+def _frequency_values(columns):
+    # 'F89.5' -> 89.5
+    return np.array([float(col[1:]) for col in columns])
+
+class GroupedStats:
+    """
+    Running count, mean, sum of squared deviations (m2), min and max of each column, per group.
+    Missing values are skipped, so counts are per group and column.
+
+    Every statistic is a (groups x columns) DataFrame.
+    """
+    def __init__(self, columns):
+        self.columns = list(columns)
+        empty = lambda: pd.DataFrame(columns=self.columns, dtype=float)
+        self.count, self.mean, self.m2, self.min, self.max = empty(), empty(), empty(), empty(), empty()
+
+    @classmethod
+    def from_frame(cls, values, keys):
+        """
+        Statistics of the rows of values, grouped by keys (a Series, or a list of them for a
+        MultiIndex).
+        """
+        stats = cls(values.columns)
+        groups = values.groupby(keys, sort=False)
+        stats.count = groups.count().astype(float)
+        stats.mean = groups.mean()
+        stats.m2 = groups.var(ddof=0) * stats.count
+        stats.min = groups.min()
+        stats.max = groups.max()
+        return stats
+
+    def update(self, values, keys):
+        return self.merge(GroupedStats.from_frame(values, keys))
+
+    def merge(self, other):
+        """
+        Merges the statistics of other into these (Chan et al. parallel update) and returns self.
+        """
+        if len(other.count) == 0:
+            return self
+        if len(self.count) == 0:
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return self
+        index = self.count.index.union(other.count.index, sort=False)
+        align = lambda df, fill: df.reindex(index).to_numpy(dtype=float, na_value=fill) if fill is not None else df.reindex(index).to_numpy(dtype=float)
+        n_a, n_b = align(self.count, 0.0), align(other.count, 0.0)
+        mean_a, mean_b = align(self.mean, 0.0), align(other.mean, 0.0)
+        n = n_a + n_b
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = mean_b - mean_a
+            mean = np.where(n > 0, mean_a + delta * n_b / n, np.nan)
+            m2 = align(self.m2, 0.0) + align(other.m2, 0.0) + np.where(n > 0, delta ** 2 * n_a * n_b / n, 0.0)
+        frame = lambda array: pd.DataFrame(array, index=index, columns=self.columns)
+        self.count = frame(n)
+        self.mean = frame(mean)
+        self.m2 = frame(np.where(n > 0, m2, np.nan))
+        self.min = frame(np.fmin(align(self.min, None), align(other.min, None)))
+        self.max = frame(np.fmax(align(self.max, None), align(other.max, None)))
+        return self
+
+    def variance(self, ddof = 1):
+        return self.m2 / (self.count - ddof).where(self.count > ddof)
+
+    def std(self, ddof = 1):
+        return np.sqrt(self.variance(ddof))
+
+    def summary(self, ddof = 1):
+        """
+        Returns a long DataFrame with one row per group and column: group, column, count,
+        mean, std, min and max.
+        """
+        parts = {'count': self.count, 'mean': self.mean, 'std': self.std(ddof), 'min': self.min, 'max': self.max}
+        long = pd.concat({name: df.stack(future_stack=True) for name, df in parts.items()}, axis=1)
+        long.index.names = ['group', 'column'] if self.count.index.nlevels == 1 else \
+            list(self.count.index.names) + ['column']
+        return long.reset_index()
+
+class PairwiseCovariance:
+    """
+    Running covariance of the columns over pairwise-complete rows, like DataFrame.cov/corr.
+
+    For every pair of columns (i, j) it keeps the number of rows where both are present (n),
+    the mean of column i over those rows (mean; the mean of column j is its transpose), the
+    sum of squared deviations of column i over them (m2) and the co-moment (c).
+    """
+    def __init__(self, columns):
+        self.columns = list(columns)
+        size = len(self.columns)
+        self.n = np.zeros((size, size))
+        self.mean = np.zeros((size, size))
+        self.m2 = np.zeros((size, size))
+        self.c = np.zeros((size, size))
+
+    @classmethod
+    def from_array(cls, X, columns):
+        stats = cls(columns)
+        present = ~np.isnan(X)
+        mask = present.astype(float)
+        # Shift by the chunk means for numerical stability; the moments do not depend on it
+        with np.errstate(invalid='ignore'):
+            shift = np.nan_to_num(np.nanmean(np.where(present.any(axis=0), X, 0.0), axis=0))
+        centered = np.where(present, X - shift, 0.0)
+        n = mask.T @ mask
+        sums = centered.T @ mask                      # sums[i, j]: sum of column i where j is present
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stats.n = n
+            stats.mean = np.where(n > 0, sums / n, 0.0) + shift[:, None]
+            stats.m2 = np.where(n > 0, (centered ** 2).T @ mask - np.where(n > 0, sums ** 2 / n, 0.0), 0.0)
+            stats.c = np.where(n > 0, centered.T @ centered - np.where(n > 0, sums * sums.T / n, 0.0), 0.0)
+        return stats
+
+    def update(self, X):
+        return self.merge(PairwiseCovariance.from_array(np.asarray(X, dtype=float), self.columns))
+
+    def merge(self, other):
+        """
+        Merges the moments of other into these and returns self.
+        """
+        n = self.n + other.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(n > 0, self.n * other.n / n, 0.0)
+            delta = other.mean - self.mean
+            self.c = self.c + other.c + delta * delta.T * weight
+            self.m2 = self.m2 + other.m2 + delta ** 2 * weight
+            self.mean = np.where(n > 0, self.mean + delta * np.where(n > 0, other.n / n, 0.0), 0.0)
+        self.n = n
+        return self
+
+    def covariance(self, ddof = 1):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = np.where(self.n > ddof, self.c / (self.n - ddof), np.nan)
+        return pd.DataFrame(cov, index=self.columns, columns=self.columns)
+
+    def correlation(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = np.where(self.n > 1, self.c / np.sqrt(self.m2 * self.m2.T), np.nan)
+        return pd.DataFrame(np.clip(corr, -1, 1), index=self.columns, columns=self.columns)
+
+class FrequencyStatistics:
+    """
+    The statistics engine: feed it chunks of a loaded dataset with update(), combine partial
+    results with merge(), then read the EDA summaries.
+
+    Parameters:
+        columns (list, optional): The frequency columns; all 'F*' columns of the first chunk by default.
+        track_columns (list): Frequencies followed per fish over Ping_time.
+        bin_seconds (float): Width of the Ping_time bins of the tracked frequencies.
+        covariance (bool): Whether to keep the covariance matrix of the columns.
+    """
+    def __init__(self, columns = None, track_columns = ['F45', 'F89.5', 'F175', 'F260'], bin_seconds = 1.0, covariance = True):
+        self.columns = list(columns) if columns is not None else None
+        self.track_columns = list(track_columns)
+        self.bin_seconds = bin_seconds
+        self.keep_covariance = covariance
+        self.rows = 0
+        self.fish_species = {}
+        if self.columns is not None:
+            self._init_stats()
+
+    def _init_stats(self):
+        self.overall = GroupedStats(self.columns)
+        self.by_species = GroupedStats(self.columns)
+        self.by_fish = GroupedStats(self.columns)
+        self.track_columns = [col for col in self.track_columns if col in self.columns]
+        self.pings = GroupedStats(self.track_columns)
+        self.covariance_stats = PairwiseCovariance(self.columns) if self.keep_covariance else None
+
+    @profiled()
+    def update(self, chunk):
+        """
+        Adds the rows of a chunk (a DataFrame as returned by load_dataset) and returns self.
+        """
+        if self.columns is None:
+            self.columns = frequency_columns(chunk.columns)
+            self._init_stats()
+        values = chunk[self.columns].astype(float)
+        self.overall.update(values, pd.Series('all', index=chunk.index))
+        self.by_species.update(values, chunk['Spe'])
+        self.by_fish.update(values, chunk['fishNum'])
+        if 'Ping_time' in chunk and self.track_columns:
+            ping_bin = pd.Series(to_ping_time_us(chunk['Ping_time']) // int(self.bin_seconds * 1e6), index=chunk.index, name='ping_bin')
+            self.pings.update(values[self.track_columns], [chunk['fishNum'], ping_bin])
+        if self.covariance_stats is not None:
+            self.covariance_stats.update(values.to_numpy())
+        self.fish_species.update(chunk.drop_duplicates('fishNum').set_index('fishNum')['Spe'].to_dict())
+        self.rows += len(chunk)
+        count('running_stats.rows', len(chunk))
+        return self
+
+    def merge(self, other):
+        """
+        Merges another (partial) FrequencyStatistics over the same columns and returns self.
+        """
+        if other.columns is None:
+            return self
+        if self.columns is None:
+            self.__dict__.update(other.__dict__)
+            return self
+        if other.columns != self.columns:
+            raise ValueError("Cannot merge statistics over different columns.")
+        self.overall.merge(other.overall)
+        self.by_species.merge(other.by_species)
+        self.by_fish.merge(other.by_fish)
+        self.pings.merge(other.pings)
+        if self.covariance_stats is not None and other.covariance_stats is not None:
+            self.covariance_stats.merge(other.covariance_stats)
+        self.fish_species.update(other.fish_species)
+        self.rows += other.rows
+        return self
+
+    def response_by_group(self, level = 'species', groups = None):
+        """
+        Returns the response of each frequency per group, sorted by frequency: a long
+        DataFrame with columns group, column, frequency, count, mean, std, min and max.
+
+        Parameters:
+            level (str): 'species', 'fish' or 'overall'.
+            groups (list, optional): Only these species/fish, in this order.
+        """
+        stats = {'species': self.by_species, 'fish': self.by_fish, 'overall': self.overall}[level]
+        summary = stats.summary()
+        summary.insert(2, 'frequency', _frequency_values(summary['column']))
+        if groups is not None:
+            summary = summary[summary['group'].isin(groups)]
+            summary['group'] = pd.Categorical(summary['group'], categories=groups, ordered=True)
+        return summary.sort_values(['group', 'frequency'], kind='stable').reset_index(drop=True)
+
+    def fish_means(self):
+        """
+        Returns the mean response per fish as a DataFrame with fishNum, Spe and the frequency
+        columns, like df_grouped in '1. EDA.ipynb'.
+        """
+        means = self.by_fish.mean.sort_index()
+        # Rebuilt from one array: the grouped statistics can be spread over many blocks
+        frame = pd.DataFrame(means.to_numpy(dtype=float), columns=means.columns)
+        frame.insert(0, 'fishNum', means.index.to_numpy())
+        frame.insert(1, 'Spe', means.index.map(self.fish_species).to_numpy())
+        return frame
+
+    def ping_series(self, fish):
+        """
+        Returns the mean response of the tracked frequencies per Ping_time bin for one fish,
+        indexed by the bin start (seconds since midnight).
+        """
+        means = self.pings.mean
+        series = means.xs(fish, level=0).sort_index()
+        series.index = series.index * self.bin_seconds
+        series.index.name = 'Ping_time'
+        return series
+
+    def covariance(self, columns = None):
+        cov = self.covariance_stats.covariance()
+        return cov.loc[columns, columns] if columns is not None else cov
+
+    def correlation(self, columns = None):
+        """
+        Returns the Pearson correlation matrix of the frequency columns (or the given subset).
+        """
+        corr = self.covariance_stats.correlation()
+        return corr.loc[columns, columns] if columns is not None else corr
+
+    def save(self, path):
+        joblib.dump(self, path)
+
+    @staticmethod
+    def load(path):
+        return joblib.load(path)
+
+# Engine settings of a worker process, set once by _init_worker
+_worker = {}
+
+def _init_worker(engine_kwargs):
+    _worker['engine_kwargs'] = engine_kwargs
+
+def _summarize_chunk(chunk):
+    return FrequencyStatistics(**_worker['engine_kwargs']).update(chunk)
+
+@profiled()
+def compute_statistics(data_path, chunksize = 100000, target_classes = [], exclude_individuals = [], n_jobs = 1,
+                       use_cache = False, **engine_kwargs):
+    """
+    Computes the FrequencyStatistics of a dataset file in one pass over its chunks.
+
+    Parameters:
+        data_path (str): The dataset file.
+        chunksize (int): Rows read per chunk; bounds the memory used.
+        target_classes, exclude_individuals, use_cache: As in load_dataset.load_chunks.
+        n_jobs (int): Worker processes summarizing chunks (-1 for all CPUs). The parent reads
+            the chunks, keeps at most 2 * n_jobs of them in flight and merges the partial
+            results as they come back.
+        **engine_kwargs: Arguments of FrequencyStatistics.
+    """
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count()
+    chunks = load_chunks(data_path, chunksize, target_classes, exclude_individuals, use_cache)
+    stats = FrequencyStatistics(**engine_kwargs)
+    if n_jobs <= 1:
+        for chunk in chunks:
+            stats.update(chunk)
+        return stats
+
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(engine_kwargs,)) as executor:
+        pending = []
+        for chunk in chunks:
+            pending.append(executor.submit(_summarize_chunk, chunk))
+            if len(pending) >= 2 * n_jobs:
+                stats.merge(pending.pop(0).result())
+        for future in pending:
+            stats.merge(future.result())
+    return stats
+
+if __name__ == '__main__':
+    from plot import plot_response_by_group, plot_ping_series, plot_correlation_heatmap
+    parser = argparse.ArgumentParser(description='Compute the EDA statistics of a dataset in one chunked pass and plot them.')
+    parser.add_argument('--data', default=os.path.join('..', 'Data', 'sample_data.csv'), help='dataset file')
+    parser.add_argument('--chunksize', type=int, default=100000, help='rows per chunk')
+    parser.add_argument('--n-jobs', type=int, default=1, help='worker processes (-1 for all CPUs)')
+    parser.add_argument('--bin-seconds', type=float, default=1.0, help='Ping_time bin width of the tracked frequencies')
+    parser.add_argument('--fish', nargs='*', default=['LT001', 'SMB001'], help='fish whose response over pings is plotted')
+    parser.add_argument('--output-dir', help='save the plots (and statistics.joblib) here instead of showing them')
+    args = parser.parse_args()
+
+    stats = compute_statistics(args.data, args.chunksize, n_jobs=args.n_jobs, bin_seconds=args.bin_seconds)
+    print(f"{stats.rows} rows, {len(stats.fish_species)} fish, {len(stats.columns)} frequencies")
+    print(stats.overall.summary()[['column', 'count', 'mean', 'std', 'min', 'max']].to_string(index=False, max_rows=20))
+
+    path = lambda name: os.path.join(args.output_dir, name) if args.output_dir else None
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        stats.save(path('statistics.joblib'))
+    plot_response_by_group(stats.response_by_group('species'), 'Sonar Response vs Frequency by Species',
+                           path=path('Sonar Response vs Frequency by Species.png'))
+    for fish in args.fish:
+        if fish in stats.fish_species:
+            plot_ping_series(stats.ping_series(fish), f'Frequency Response Over Pings for {fish}',
+                             path=path(f'Frequency Response Over Pings for {fish}.png'))
+    plot_correlation_heatmap(stats.correlation(stats.track_columns), path=path('Correlation Heatmap.png'))
@@ -3,56 +3,105 @@ This script creates a reproducible sample dataset from a large CSV by randomly s
 a specified number of rows for each of two species categories ('LT' and 'SMB') in the
 'Spe' column.
 
+The CSV is read once, in chunks, and a fixed-size reservoir of rows is kept per stratum
+(species, or species and fish), so memory is proportional to the sample size rather than
+to the dataset.
+
 Steps:
-1. Import pandas.
+1. Import pandas and numpy.
 2. Set a random seed for reproducibility.
-3. Specify how many rows to sample for each species.
-4. Load the full dataset into a DataFrame.
-5. Filter and sample for each species.
-6. Combine the samples, save to CSV, and preview the result.
+3. Specify how many rows to sample for each species (or fish).
+4. Stream the dataset in chunks, dropping the unwanted individuals on the fly.
+5. Keep a reservoir sample of each stratum.
+6. Combine the samples, sort, save to CSV.
 """
 
 # 1. Import relevant packages
 import pandas as pd
+import numpy as np
 import os
 
-# 2. Set random seed for reproducible sampling
-seed = 0
+def reservoir_sample(file_path, number_per_stratum, seed = 0, species = ['LT', 'SMB'], exclude_individuals = [],
+                     by_fish = False, chunksize = 100000):
+    """
+    Reservoir-samples up to number_per_stratum rows of each stratum in a single pass over the CSV.
+
+    Strata are the species, or (species, fishNum) pairs if by_fish is True. Every stratum gets
+    its own random stream, spawned from seed in order of first appearance, and consumes one
+    uniform draw per row once its reservoir is full, so the sample depends on the seed and the
+    file only, not on chunksize.
+
+    Returns the sampled rows as a DataFrame, stratum by stratum.
+    """
+    seed_sequence = np.random.SeedSequence(seed)
+    samples = {}   # stratum -> DataFrame of the sampled rows, row i being reservoir slot i
+    seen = {}      # stratum -> number of rows seen
+    rngs = {}
+
+    for chunk in pd.read_csv(file_path, chunksize=chunksize, low_memory=False):
+        # Drop the unwanted individuals and species on the fly
+        chunk = chunk[chunk['Spe'].isin(species) & ~chunk['fishNum'].isin(exclude_individuals)]
+        keys = ['Spe', 'fishNum'] if by_fish else ['Spe']
+        for stratum, rows in chunk.groupby(keys, sort=False):
+            if stratum not in rngs:
+                rngs[stratum] = np.random.default_rng(seed_sequence.spawn(1)[0])
+                seen[stratum] = 0
+            sample = samples.get(stratum)
+            size = 0 if sample is None else len(sample)
+
+            # Fill the reservoir first (slot -> position of the row within rows)
+            fill = min(len(rows), number_per_stratum - size)
+            assignments = {size + i: i for i in range(fill)}
 
-# 3. Define sample sizes for each species
-number_per_class = 500    # number of rows to sample for each Species
+            # Then row t (0-based count within the stratum) replaces a random slot with probability k/(t+1)
+            rest = len(rows) - fill
+            if rest > 0:
+                t = seen[stratum] + fill + np.arange(rest)
+                slots = np.floor(rngs[stratum].random(rest) * (t + 1)).astype(np.int64)
+                for i in np.flatnonzero(slots < number_per_stratum):
+                    assignments[int(slots[i])] = fill + i
+            seen[stratum] += len(rows)
+            if not assignments:
+                continue
 
-# 4. Load the full dataset and drop the unwanted individuals
-file_path = os.path.join('Data', 'AllFishCombined_filtered.csv')
-df = pd.read_csv(file_path, low_memory=False)
-df = df[~df['fishNum'].isin(['LT008', 'LT016'])]
+            # Copy only the rows that ended up in the reservoir, keeping every slot in place
+            positions = sorted(set(assignments.values()))
+            new_rows = rows.iloc[positions]
+            new_index = {position: n for n, position in enumerate(positions)}
+            indexer = np.arange(size + fill)
+            for slot, position in assignments.items():
+                indexer[slot] = size + new_index[position]
+            samples[stratum] = (new_rows if sample is None else pd.concat([sample, new_rows])).iloc[indexer]
 
-# 5. Filter rows where Spe is 'LT' or 'SMB'
-df_lt = df[df['Spe'] == 'LT']
-df_smb = df[df['Spe'] == 'SMB']
+    return pd.concat(list(samples.values()))
 
-# 6a. Sample the specified number of rows for each species
-sample_lt = df_lt.sample(n=number_per_class, random_state=seed)
-sample_smb = df_smb.sample(n=number_per_class, random_state=seed)
+if __name__ == '__main__':
+    # 2. Set random seed for reproducible sampling
+    seed = 0
 
-# 6b. Combine the two sampled subsets into one DataFrame
-sample_df = pd.concat([sample_lt, sample_smb]).reset_index(drop=True)
+    # 3. Define sample sizes for each species (per fish instead if by_fish is True)
+    number_per_class = 500    # number of rows to sample for each Species
+    by_fish = False
 
-# 7. Parse 'Ping_time' column as datetime for accurate sorting
-sample_df['Ping_time'] = pd.to_datetime(
-    sample_df['Ping_time'],
-    format=' %H:%M:%S.%f',
-    errors='coerce'  # ensures any malformed values become NaT
-)
+    # 4-5. Stream the dataset, dropping the unwanted individuals, and sample each species
+    file_path = os.path.join('Data', 'AllFishCombined_filtered.csv')
+    sample_df = reservoir_sample(file_path, number_per_class, seed, species=['LT', 'SMB'],
+                                 exclude_individuals=['LT008', 'LT016'], by_fish=by_fish).reset_index(drop=True)
 
-# 8. Sort by 'fishNum' first, then by 'Ping_time'
-sample_df = sample_df.sort_values(
-    by=['fishNum', 'Ping_time']
-).reset_index(drop=True)
+    # 6a. Parse 'Ping_time' once as a time of day for accurate sorting
+    sort_keys = pd.DataFrame({
+        'fishNum': sample_df['fishNum'],
+        'Ping_time': pd.to_timedelta(
+            sample_df['Ping_time'].astype(str).str.strip(),
+            errors='coerce'  # ensures any malformed values become NaT
+        )
+    })
 
-# 9. Convert 'Ping_time' back to string if you need the original format
-sample_df['Ping_time'] = sample_df['Ping_time'].dt.strftime(' %H:%M:%S.%f')
+    # 6b. Sort by 'fishNum' first, then by 'Ping_time', with NaT rows last within each fish;
+    #     the original strings are kept as they are
+    sort_order = sort_keys.sort_values(by=['fishNum', 'Ping_time'], na_position='last').index
+    sample_df = sample_df.loc[sort_order].reset_index(drop=True)
 
-# 10. Save the sampled dataset to a new CSV
-output_path = os.path.join('Data', 'sample_data.csv')
-sample_df.to_csv(output_path, index=False)
\ No newline at end of file
+    # 6c. Save the sampled dataset to a new CSV
+    output_path = os.path.join('Data', 'sample_data.csv')
+    sample_df.to_csv(output_path, index=False)
\ No newline at end of file
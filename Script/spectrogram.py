@@ -1,21 +1,27 @@
 import os
 import pandas as pd
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+from load_dataset import FishPingDataset, to_ping_time_us, frequency_columns
+from profiling import profiled
 
+@profiled(trace=False)
 def get_single_spectrogram(df, spe, desired_length = 50,init_stat = 0):
     """
     Generates ONE spectrogram by:
       1) Randomly picking one fishNum from the given species (spe).
       2) Randomly sampling 'desired_length' rows from that fish.
-      3) Converting Ping_time to datetime, sorting, and normalizing time.
+      3) Converting Ping_time to integer microseconds, sorting, and normalizing time.
       4) Interpolating the frequency columns onto a [0..1] grid of size 'desired_length'.
     
     Returns:
       spectrogram (np.ndarray of shape (desired_length, num_freqs))
     """
     # Identify frequency columns
-    freq_cols = [col for col in df.columns if col.startswith('F')]
+    freq_cols = frequency_columns(df.columns)
     
     # Subset to only rows of this species
     df_spe = df[df['Spe'] == spe]
@@ -35,15 +41,14 @@ def get_single_spectrogram(df, spe, desired_length = 50,init_stat = 0):
     else:
         df_sampled = df_fish.sample(n=desired_length, replace=False, random_state=init_stat)
     
-    # Convert ping times to datetime
-    df_sampled['Ping_time_dt'] = pd.to_datetime(df_sampled['Ping_time'], format= " %H:%M:%S.%f")
+    # Convert ping times to microseconds since midnight (no-op if already loaded that way)
+    df_sampled['Ping_time_us'] = to_ping_time_us(df_sampled['Ping_time'])
     # Sort by chronological order
-    df_sampled = df_sampled.sort_values('Ping_time_dt')
+    df_sampled = df_sampled.sort_values('Ping_time_us')
     
     # Convert to "seconds since first ping"
-    times = df_sampled['Ping_time_dt']
-    t_min = times.iloc[0]
-    times_sec = times.apply(lambda x: (x - t_min).total_seconds()).values
+    times = df_sampled['Ping_time_us'].values
+    times_sec = (times - times[0]) / 1e6
     
     # Normalize time from 0 to 1
     t_min_val = times_sec.min()
@@ -75,6 +80,7 @@ def get_single_spectrogram(df, spe, desired_length = 50,init_stat = 0):
     return spectrogram
 
 
+@profiled(trace=False)
 def get_class_spectrograms(df, spe, desired_length = 50, iteration_for_class = 10, init_stat = 0):
     """
     Generates multiple spectrograms for a single species (spe).
@@ -91,34 +97,201 @@ def get_class_spectrograms(df, spe, desired_length = 50, iteration_for_class = 1
     
     return spectrogram_list        
 
-def save_spectrograms(spectrogram_array, prefix = "Spe_", num_to_save = 1, folder = "spectrograms"):
+@profiled(trace=False)
+def interpolate_spectrograms(norm_times, freq_data, desired_length = 50):
     """
-    Save a specified number of spectrograms from an array to a local folder.
+    Batched equivalent of calling np.interp for every frequency column of every spectrogram.
     
     Parameters:
-        spectrogram_array (list or np.ndarray): 
-            An array or list of 2D spectrograms (each should be a 2D numpy array).
-        prefix (str): 
-            The prefix to use for the saved file names.
-        num_to_save (int): 
-            The number of spectrogram images to save.
-        folder (str): 
-            The target folder to save images. Default is "spectrograms".
+        norm_times (np.ndarray): (N, L) sorted ping times of each spectrogram, normalized to [0..1].
+        freq_data (np.ndarray): (N, L, num_freqs) frequency rows matching norm_times.
+        desired_length (int): Size of the uniform [0..1] grid to interpolate onto.
+    
+    Returns:
+        np.ndarray of shape (N, desired_length, num_freqs).
     """
-    # Create the folder if it doesn't exist
-    os.makedirs(folder, exist_ok=True)
+    num_rows = norm_times.shape[1]
+    desired_grid = np.linspace(0, 1, num=desired_length)
     
-    # Ensure we do not exceed the available number of spectrograms
-    num_to_save = min(num_to_save, len(spectrogram_array))
+    # Index of the last sampled time <= each grid point (same bracket as np.interp)
+    left = (norm_times[:, None, :] <= desired_grid[None, :, None]).sum(axis=2) - 1
+    left = np.clip(left, 0, num_rows - 1)
+    at_end = left == num_rows - 1
+    right = np.minimum(left + 1, num_rows - 1)
     
-    for i in range(num_to_save):
-        # Get the spectrogram (assumed to be a 2D numpy array)
-        spec = spectrogram_array[i]
-        # Create a filename using the prefix and index
-        filename = os.path.join(folder, f"{prefix}{i}.png")
-        # Save the spectrogram image; change cmap if desired (e.g., 'viridis', 'gray')
-        # plt.imsave(filename, spec, cmap='viridis')
+    x_left = np.take_along_axis(norm_times, left, axis=1)
+    x_right = np.take_along_axis(norm_times, right, axis=1)
+    span = np.where(at_end, 1.0, x_right - x_left)
+    weight = np.where(at_end, 0.0, (desired_grid[None, :] - x_left) / span)
+    
+    f_left = np.take_along_axis(freq_data, left[:, :, None], axis=1)
+    f_right = np.take_along_axis(freq_data, right[:, :, None], axis=1)
+    return f_left + weight[:, :, None] * (f_right - f_left)
+
+@profiled(trace=False)
+def get_class_spectrograms_batched(data, spe, desired_length = 50, iteration_for_class = 10, init_stat = 0):
+    """
+    Vectorized version of get_class_spectrograms.
+    
+    Ping times are parsed once per dataset (see FishPingDataset), all sample indices are
+    drawn up front, and the whole batch is interpolated in one operation. Fish choices use
+    the global NumPy RNG and spectrogram i samples its rows with seed init_stat + i, exactly
+    like get_class_spectrograms.
+    
+    Parameters:
+        data (pd.DataFrame or FishPingDataset): The loaded dataset.
+        spe (str): The species to build spectrograms for.
+        desired_length (int): Number of rows sampled for, and time steps in, each spectrogram.
+        iteration_for_class (int): Number of spectrograms to build.
+        init_stat (int): Seed of the first spectrogram's row sampling.
+    
+    Returns:
+        np.ndarray of shape (iteration_for_class, desired_length, num_freqs), float32.
+    """
+    dataset = data if isinstance(data, FishPingDataset) else FishPingDataset(data)
+    fish_list = dataset.fish_of_species(spe)
+    
+    # Draw every row index up front; rows are positions in the dataset's arrays
+    rows = np.empty((iteration_for_class, desired_length), dtype=np.int64)
+    for i in range(iteration_for_class):
+        chosen_fish = np.random.choice(fish_list)
+        start, stop = dataset.fish_offsets[chosen_fish]
+        num_rows = stop - start
+        # Sample with replacement if not enough rows (same draw as DataFrame.sample)
+        sampled = np.random.RandomState(init_stat + i).choice(num_rows, size=desired_length, replace=num_rows < desired_length)
+        rows[i] = start + sampled
+    
+    return rows_to_spectrograms(dataset, rows, desired_length)
+
+def rows_to_spectrograms(dataset, rows, desired_length = 50):
+    """
+    Builds spectrograms from sampled rows of a FishPingDataset: each row of 'rows' (one
+    spectrogram) is sorted chronologically, then time-normalized and interpolated.
+    Returns a (len(rows), desired_length, num_freqs) float32 array.
+    """
+    # Sort each sample chronologically (same sort kind as pandas' sort_values)
+    times = dataset.ping_us[rows]
+    order = np.argsort(times, axis=1, kind='quicksort')
+    rows = np.take_along_axis(rows, order, axis=1)
+    times = np.take_along_axis(times, order, axis=1)
+    return windows_to_spectrograms(times, dataset.features[rows].astype(np.float64), desired_length)
+
+def sample_spectrogram(dataset, spe, desired_length = 50, rng = None):
+    """
+    Generates ONE spectrogram like get_single_spectrogram, but from a FishPingDataset and
+    with every random draw taken from 'rng' (a np.random.Generator or a seed).
+    
+    Returns:
+      spectrogram (np.ndarray of shape (desired_length, num_freqs)), float32
+    """
+    rng = np.random.default_rng(rng)
+    fish_list = dataset.fish_of_species(spe)
+    start, stop = dataset.fish_offsets[fish_list[rng.integers(len(fish_list))]]
+    num_rows = stop - start
+    # Randomly sample 'desired_length' rows (with replacement if not enough rows)
+    sampled = rng.choice(num_rows, size=desired_length, replace=num_rows < desired_length)
+    return rows_to_spectrograms(dataset, (start + sampled)[np.newaxis, :], desired_length)[0]
+
+def fish_windows(dataset, fish, window_length = 50, stride = 1):
+    """
+    Returns the sliding windows over the chronologically sorted pings of one fish as strided
+    views, so overlapping windows share memory (the fish is sorted once).
+    
+    Returns:
+      times (np.ndarray): (num_windows, window_length) view of the ping times in microseconds.
+      features (np.ndarray): (num_windows, window_length, num_freqs) view of the frequency rows.
+      Both are empty if the fish has fewer than window_length pings.
+    """
+    rows = dataset.fish_rows(fish)
+    order = np.argsort(dataset.ping_us[rows], kind='stable')
+    times = dataset.ping_us[rows][order]
+    features = dataset.features[rows][order]
+    if len(times) < window_length:
+        return times[:0].reshape(0, window_length), features[:0].reshape(0, window_length, features.shape[1])
+    time_windows = sliding_window_view(times, window_length)[::stride]
+    feature_windows = sliding_window_view(features, window_length, axis=0)[::stride].transpose(0, 2, 1)
+    return time_windows, feature_windows
+
+@profiled(trace=False)
+def windows_to_spectrograms(times, features, desired_length = 50):
+    """
+    Time-normalizes a batch of windows and interpolates them onto a [0..1] grid of
+    'desired_length' steps. Returns a (num_windows, desired_length, num_freqs) float32 array.
+    """
+    times_sec = (times - times[:, :1]) / 1e6
+    span = times_sec[:, -1:]
+    identical = span[:, 0] == 0
+    norm_times = times_sec / np.where(span == 0, 1.0, span)
+    spectrograms = interpolate_spectrograms(norm_times, features, desired_length)
+    # Edge case: all times identical, just repeat the first row
+    spectrograms[identical] = features[identical, :1, :]
+    return spectrograms.astype(np.float32)
+
+def sliding_window_spectrograms(data, spe, desired_length = 50, stride = 1, batch_size = 256, window_length = None,
+                                fish_list = None, shuffle = False, seed = 0):
+    """
+    Lazily generates spectrograms from contiguous ping sequences instead of random samples.
+    
+    Each fish of the species is sorted once, and fixed-length windows of consecutive pings
+    are taken every 'stride' pings as strided views. Only the batch being yielded is
+    time-normalized and interpolated, so memory stays bounded by batch_size.
+    
+    Parameters:
+        data (pd.DataFrame or FishPingDataset): The loaded dataset.
+        spe (str): The species to build spectrograms for.
+        desired_length (int): Number of time steps of each spectrogram.
+        stride (int): Number of pings between the starts of consecutive windows.
+        batch_size (int): Maximum number of spectrograms per yielded batch.
+        window_length (int, optional): Number of pings per window (default: desired_length).
+        fish_list (list, optional): Restrict to these fish (default: every fish of the species).
+        shuffle (bool): Shuffle the fish order and the window order within each fish.
+        seed (int): Seed used when shuffling.
+    
+    Yields:
+        (spectrograms, fish) batches: a (B, desired_length, num_freqs) float32 array and the
+        fishNum of each spectrogram.
+    """
+    dataset = data if isinstance(data, FishPingDataset) else FishPingDataset(data)
+    window_length = window_length or desired_length
+    fish_list = list(dataset.fish_of_species(spe) if fish_list is None else fish_list)
+    rng = np.random.default_rng(seed)
+    if shuffle:
+        rng.shuffle(fish_list)
+    
+    for fish in fish_list:
+        time_windows, feature_windows = fish_windows(dataset, fish, window_length, stride)
+        starts = np.arange(len(time_windows))
+        if shuffle:
+            rng.shuffle(starts)
+        for batch_start in range(0, len(starts), batch_size):
+            batch = starts[batch_start:batch_start + batch_size]
+            if not shuffle:
+                batch = slice(batch[0], batch[-1] + 1)
+            spectrograms = windows_to_spectrograms(time_windows[batch], feature_windows[batch], desired_length)
+            yield spectrograms, np.full(len(spectrograms), fish, dtype=object)
+
+def colormap_images(spectrograms, cmap = 'viridis', vmin = None, vmax = None):
+    """
+    Converts spectrograms straight into RGBA uint8 images through a matplotlib colormap,
+    without creating any figure. Each spectrogram is scaled to its own min/max (like imshow)
+    unless vmin/vmax are given. Missing values are drawn with the colormap's 'bad' color.
+    
+    Returns:
+      np.ndarray of shape (num_spectrograms, height, width, 4), uint8
+    """
+    spectrograms = np.asarray(spectrograms, dtype=np.float64)
+    low = np.nanmin(spectrograms, axis=(1, 2), keepdims=True) if vmin is None else vmin
+    high = np.nanmax(spectrograms, axis=(1, 2), keepdims=True) if vmax is None else vmax
+    with np.errstate(invalid='ignore', divide='ignore'):
+        normalized = (spectrograms - low) / np.where(high > low, high - low, 1.0)
+    return matplotlib.colormaps[cmap](np.ma.masked_invalid(normalized), bytes=True)
 
+def _init_export_worker():
+    # Worker processes only ever draw to files
+    plt.switch_backend('Agg')
+
+def _save_figures(specs, filenames):
+    for spec, filename in zip(specs, filenames):
         fig, ax = plt.subplots(figsize=(6, 6))
         
         # Plot the spectrogram ensuring a square aspect ratio.
@@ -140,4 +313,94 @@ def save_spectrograms(spectrogram_array, prefix = "Spe_", num_to_save = 1, folde
         plt.tight_layout()
         fig.savefig(filename)
         plt.close(fig)
-        print(f"Saved {filename}")
+
+def _save_raw_images(specs, filenames, cmap, upscale):
+    images = colormap_images(specs, cmap)
+    if upscale > 1:
+        images = images.repeat(upscale, axis=1).repeat(upscale, axis=2)
+    for image, filename in zip(images, filenames):
+        plt.imsave(filename, image)
+
+def contact_sheet(spectrograms, ncols = None, cmap = 'viridis', upscale = 1, padding = 2):
+    """
+    Tiles colormapped spectrograms into a single RGBA image (ncols defaults to a square grid).
+    """
+    images = colormap_images(spectrograms, cmap)
+    if upscale > 1:
+        images = images.repeat(upscale, axis=1).repeat(upscale, axis=2)
+    num, height, width, _ = images.shape
+    ncols = ncols or int(np.ceil(np.sqrt(num)))
+    nrows = -(-num // ncols)
+    sheet = np.full((nrows * (height + padding) + padding, ncols * (width + padding) + padding, 4), 255, dtype=np.uint8)
+    for i, image in enumerate(images):
+        top = padding + (i // ncols) * (height + padding)
+        left = padding + (i % ncols) * (width + padding)
+        sheet[top:top + height, left:left + width] = image
+    return sheet
+
+def save_spectrograms(spectrogram_array, prefix = "Spe_", num_to_save = 1, folder = "spectrograms",
+                      mode = "figure", cmap = "viridis", upscale = 1, n_jobs = 1, verbose = True):
+    """
+    Save a specified number of spectrograms from an array to a local folder.
+    
+    Parameters:
+        spectrogram_array (list or np.ndarray): 
+            An array or list of 2D spectrograms (each should be a 2D numpy array).
+        prefix (str): 
+            The prefix to use for the saved file names.
+        num_to_save (int): 
+            The number of spectrogram images to save.
+        folder (str): 
+            The target folder to save images. Default is "spectrograms".
+        mode (str):
+            "figure": one labelled figure with colorbar per spectrogram (<prefix><i>.png).
+            "raw": colormapped pixels written straight from the arrays, no figure (<prefix><i>.png).
+            "sheet": all spectrograms tiled into one contact sheet (<prefix>sheet.png).
+            "npz": the arrays themselves in one compressed archive (<prefix>spectrograms.npz).
+        cmap (str):
+            Colormap of the "raw" and "sheet" images.
+        upscale (int):
+            Pixel repetition of the "raw" and "sheet" images.
+        n_jobs (int):
+            Worker processes for the "figure" and "raw" modes (-1 for all cores).
+        verbose (bool):
+            Print every saved file.
+    
+    Returns:
+        list of the written file paths.
+    """
+    # Create the folder if it doesn't exist
+    os.makedirs(folder, exist_ok=True)
+    
+    # Ensure we do not exceed the available number of spectrograms
+    num_to_save = min(num_to_save, len(spectrogram_array))
+    specs = np.asarray([np.asarray(spectrogram_array[i]) for i in range(num_to_save)])
+    
+    if mode == "npz":
+        filenames = [os.path.join(folder, f"{prefix}spectrograms.npz")]
+        np.savez_compressed(filenames[0], spectrograms=specs)
+    elif mode == "sheet":
+        filenames = [os.path.join(folder, f"{prefix}sheet.png")]
+        plt.imsave(filenames[0], contact_sheet(specs, cmap=cmap, upscale=upscale))
+    elif mode in ("figure", "raw"):
+        # Create a filename using the prefix and index
+        filenames = [os.path.join(folder, f"{prefix}{i}.png") for i in range(num_to_save)]
+        if n_jobs is None or n_jobs < 1:
+            n_jobs = os.cpu_count()
+        chunks = [chunk for chunk in np.array_split(np.arange(num_to_save), n_jobs) if len(chunk)]
+        tasks = [(_save_figures, (specs[chunk], [filenames[i] for i in chunk])) if mode == "figure" else
+                 (_save_raw_images, (specs[chunk], [filenames[i] for i in chunk], cmap, upscale)) for chunk in chunks]
+        if n_jobs == 1:
+            for fn, args in tasks:
+                fn(*args)
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_export_worker) as executor:
+                for future in [executor.submit(fn, *args) for fn, args in tasks]:
+                    future.result()
+    else:
+        raise ValueError(f"Unknown mode '{mode}'; use 'figure', 'raw', 'sheet' or 'npz'.")
+    
+    if verbose:
+        for filename in filenames:
+            print(f"Saved {filename}")
+    return filenames
@@ -0,0 +1,133 @@
+"""
+torch Datasets that generate spectrograms (see spectrogram.py) while the CNN trains,
+instead of materializing every spectrogram in memory up front.
+
+Run this file to stream the sliding-window dataset through a DataLoader and print the
+species mix of its batches:
+    python spectrogram_dataset.py --data ../Data/sample_data.csv --batch-size 32
+"""
+import os
+import argparse
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset, IterableDataset, get_worker_info
+from load_dataset import FishPingDataset, load_from_path
+from spectrogram import fish_windows, windows_to_spectrograms, sample_spectrogram
+
+class SlidingWindowSpectrogramDataset(IterableDataset):
+    """
+    Streams sliding-window spectrograms (see sliding_window_spectrograms) of several species.
+
+    Each item is (spectrogram, label): a (1, desired_length, num_freqs) float32 tensor and the
+    index of its species in 'species'. The windows of all fish are interleaved in a seeded
+    random order in which every fish appears in proportion to its remaining windows, so
+    DataLoader batches mix species and fish throughout the epoch (a fish's own windows keep
+    their time order unless shuffle is True). Spectrograms are interpolated in blocks of
+    about batch_size windows in total across the fish.
+
+    With DataLoader worker processes, the fish are split between the workers. Call
+    set_epoch to draw a new order for a new epoch.
+    """
+    def __init__(self, data, species = ['LT', 'SMB'], desired_length = 50, stride = 1, window_length = None,
+                 batch_size = 256, shuffle = False, seed = 0):
+        self.dataset = data if isinstance(data, FishPingDataset) else FishPingDataset(data)
+        self.species = species
+        self.desired_length = desired_length
+        self.stride = stride
+        self.window_length = window_length
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _fish_spectrograms(self, fish, block_size, rng):
+        # Spectrograms of one fish's windows, interpolated block_size windows at a time
+        time_windows, feature_windows = fish_windows(self.dataset, fish, self.window_length or self.desired_length, self.stride)
+        starts = np.arange(len(time_windows))
+        if self.shuffle:
+            rng.shuffle(starts)
+        for block_start in range(0, len(starts), block_size):
+            block = starts[block_start:block_start + block_size]
+            if not self.shuffle:
+                block = slice(block[0], block[-1] + 1)
+            spectrograms = windows_to_spectrograms(time_windows[block], feature_windows[block], self.desired_length)
+            yield from torch.from_numpy(spectrograms[:, np.newaxis])
+
+    def __iter__(self):
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker is not None else (0, 1)
+        window_length = self.window_length or self.desired_length
+        # Every worker takes every num_workers-th fish
+        fish_labels = [(fish, label) for label, spe in enumerate(self.species) for fish in self.dataset.fish_of_species(spe)]
+        fish_labels = fish_labels[worker_id::num_workers]
+        num_pings = np.array([np.subtract(*self.dataset.fish_offsets[fish][::-1]) for fish, _ in fish_labels], dtype=np.int64)
+        counts = np.maximum(0, (num_pings - window_length) // self.stride + 1)
+        if counts.sum() == 0:
+            return
+
+        rng = np.random.default_rng((self.seed, self.epoch, worker_id))
+        block_size = max(1, self.batch_size // int((counts > 0).sum()))
+        streams = [self._fish_spectrograms(fish, block_size, np.random.default_rng((self.seed, self.epoch, worker_id, i)))
+                   for i, (fish, _) in enumerate(fish_labels)]
+        # A uniformly random interleaving of the fish's window sequences
+        for i in rng.permutation(np.repeat(np.arange(len(fish_labels)), counts)):
+            yield next(streams[i]), fish_labels[i][1]
+
+class RandomSpectrogramDataset(Dataset):
+    """
+    Randomly sampled spectrograms (like get_class_spectrograms) generated lazily per index.
+
+    Item i is (spectrogram, label): spectrogram number i % number_per_class of species
+    species[i // number_per_class], as a (1, desired_length, num_freqs) float32 tensor. It is
+    drawn from a generator seeded with (init_stat, epoch, i), so it is reproducible whatever
+    the DataLoader workers or shuffling, and never stored. set_epoch draws a fresh set of
+    augmentations for a new epoch (keep persistent_workers off so the workers see it).
+    """
+    def __init__(self, data, species = ['LT', 'SMB'], number_per_class = 200, desired_length = 50, init_stat = 0):
+        self.dataset = data if isinstance(data, FishPingDataset) else FishPingDataset(data)
+        self.species = species
+        self.number_per_class = number_per_class
+        self.desired_length = desired_length
+        self.init_stat = init_stat
+        self.epoch = 0
+        self.labels = np.repeat(np.arange(len(species)), number_per_class)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.species) * self.number_per_class
+
+    def __getitem__(self, index):
+        label = index // self.number_per_class
+        rng = np.random.default_rng((self.init_stat, self.epoch, index))
+        spectrogram = sample_spectrogram(self.dataset, self.species[label], self.desired_length, rng)
+        return torch.from_numpy(spectrogram[np.newaxis]), label
+
+def batch_class_fractions(loader, num_classes = 2):
+    """
+    Returns the fraction of each class in every batch of a DataLoader, as a
+    (num_batches, num_classes) array.
+    """
+    return np.array([np.bincount(labels.numpy(), minlength=num_classes) / len(labels) for _, labels in loader])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the species mix of the sliding-window spectrogram batches.')
+    parser.add_argument('--data', default=os.path.join('..', 'Data', 'sample_data.csv'), help='dataset to stream')
+    parser.add_argument('--batch-size', type=int, default=32, help='DataLoader batch size')
+    parser.add_argument('--window-length', type=int, default=5, help='pings per window')
+    parser.add_argument('--num-workers', type=int, default=0, help='DataLoader worker processes')
+    parser.add_argument('--shuffle', action='store_true', help='also shuffle the windows within each fish')
+    args = parser.parse_args()
+
+    species = ['LT', 'SMB']
+    dataset = SlidingWindowSpectrogramDataset(load_from_path(args.data, species, ['LT008', 'LT016']), species,
+                                              window_length=args.window_length, shuffle=args.shuffle)
+    loader = DataLoader(dataset, batch_size=args.batch_size, num_workers=args.num_workers)
+    fractions = batch_class_fractions(loader, len(species))
+    print(f"{len(fractions)} batches, {species[1]} fraction per batch: min {fractions[:, 1].min():.2f}, "
+          f"mean {fractions[:, 1].mean():.2f}, max {fractions[:, 1].max():.2f}; "
+          f"single-species batches: {int((fractions.max(axis=1) == 1.0).sum())}")
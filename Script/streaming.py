@@ -0,0 +1,208 @@
+"""
+Online, per-fish species classification of time-ordered ping streams.
+
+Each tethered fish (fishNum) gets a fixed-size ring buffer of its most recent pings. Every
+incoming ping is scored once, either by a ping-level model (the MLP) or by the CNN on the
+interpolated spectrogram window ending at that ping. The running sum of the buffered scores
+is updated in O(1): the new score is added and the evicted one subtracted. Ping scores are
+summed as independent log-odds; window scores are averaged, since consecutive windows share
+all but one ping. Work per ping and memory per fish are therefore constant, and max_fish
+bounds the number of active fish.
+"""
+from collections import OrderedDict
+import numpy as np
+import torch
+from load_dataset import FishPingDataset
+
+def mlp_ping_scorer(model, scaler = None, reducer = None):
+    """
+    Wraps a trained torch MLP (see models.py) as a ping scorer: features (num_freqs,) ->
+    log-odds of class 1 (SMB) against class 0 (LT). For an MLP trained on reduced features,
+    reducer is the fitted feature_reduction.FrequencyReducer applied after the scaler.
+    """
+    model.eval()
+    # Apply the StandardScaler statistics and the reduction directly; scaler.transform and
+    # reducer.transform are slow for single rows
+    mean = scaler.mean_ if scaler is not None else 0.0
+    scale = scaler.scale_ if scaler is not None else 1.0
+    selected = reducer.selected_ if reducer is not None else None
+    pca = reducer.pca_ if reducer is not None and selected is None else None
+    def score(features):
+        features = np.nan_to_num((features - mean) / scale)
+        if selected is not None:
+            features = features[selected]
+        elif pca is not None:
+            features = (features - pca.mean_) @ pca.components_.T
+        with torch.no_grad():
+            logits = model(torch.as_tensor(features, dtype=torch.float32)[None])[0]
+        return (logits[1] - logits[0]).item()
+    return score
+
+def sklearn_ping_scorer(classifier, eps = 1e-9):
+    """
+    Wraps an inference.PingClassifier (or any object with predict_proba) as a ping scorer:
+    features (num_freqs,) -> log-odds of the second class against the first.
+    """
+    def score(features):
+        p = classifier.predict_proba(features[np.newaxis, :])[0]
+        return float(np.log(p[1] + eps) - np.log(p[0] + eps))
+    return score
+
+def cnn_window_scorer(model):
+    """
+    Wraps a trained CNNClassifier as a window scorer: spectrogram (desired_length, num_freqs) ->
+    log-odds of class 1 (SMB) against class 0 (LT).
+    """
+    model.eval()
+    def score(spectrogram):
+        with torch.no_grad():
+            logits = model(torch.as_tensor(spectrogram, dtype=torch.float32)[None, None])[0]
+        return (logits[1] - logits[0]).item()
+    return score
+
+class FishStream:
+    """
+    Ring buffer of the most recent pings of one fish, with the running sum of their scores.
+
+    Every ping is stored twice, at its ring position p and at p + window, so the buffered
+    pings are always the contiguous, chronological slice [head, head + count).
+    """
+    def __init__(self, window, num_freqs):
+        self.window = window
+        self.times = np.zeros(2 * window, dtype=np.int64)
+        self.features = np.zeros((2 * window, num_freqs), dtype=np.float32)
+        self.scores = np.zeros(window)
+        self.head = 0      # position of the oldest ping once the buffer is full
+        self.count = 0     # number of buffered pings
+        self.score_sum = 0.0
+
+    def push(self, ping_us, features):
+        """
+        Stores a ping, overwriting the oldest one once the buffer is full.
+        """
+        position = (self.head + self.count) % self.window
+        if self.count == self.window:
+            self.score_sum -= self.scores[position]
+            self.head = (self.head + 1) % self.window
+        else:
+            self.count += 1
+        self.times[[position, position + self.window]] = ping_us
+        self.features[[position, position + self.window]] = features
+        return position
+
+    def ordered(self):
+        """
+        Returns views of the buffered (times, features) in chronological order (no copy).
+        """
+        rows = slice(self.head, self.head + self.count)
+        return self.times[rows], self.features[rows]
+
+class StreamingClassifier:
+    """
+    Maintains a species estimate for each fish from its stream of pings.
+
+    Parameters:
+        ping_scorer (callable, optional): features (num_freqs,) -> log-odds, e.g. mlp_ping_scorer.
+        window_scorer (callable, optional): spectrogram (desired_length, num_freqs) -> log-odds,
+            e.g. cnn_window_scorer. Used instead of ping_scorer when given.
+        classes (list): The two species, ordered as the model's outputs.
+        window (int): Number of recent pings buffered per fish (and spectrogram rows).
+        desired_length (int): Time steps of the interpolated spectrogram window.
+        max_fish (int, optional): Maximum number of active fish; the least recently seen fish
+            is dropped beyond that.
+        prior_log_odds (float): Log-odds before any ping is seen.
+        aggregate (str, optional): How the buffered scores are combined: 'sum' (independent
+            evidence) or 'mean'. Defaults to 'sum' for ping scores and 'mean' for window
+            scores, whose windows overlap.
+    """
+    def __init__(self, ping_scorer = None, window_scorer = None, classes = ['LT', 'SMB'], window = 50,
+                 desired_length = 50, max_fish = None, prior_log_odds = 0.0, aggregate = None):
+        if ping_scorer is None and window_scorer is None:
+            raise ValueError("A ping_scorer or a window_scorer is required.")
+        self.ping_scorer = ping_scorer
+        self.window_scorer = window_scorer
+        self.classes = classes
+        self.window = window
+        self.desired_length = desired_length
+        self.max_fish = max_fish
+        self.prior_log_odds = prior_log_odds
+        self.aggregate = aggregate or ('mean' if window_scorer is not None else 'sum')
+        if self.aggregate not in ('sum', 'mean'):
+            raise ValueError(f"Unknown aggregate '{self.aggregate}'; use 'sum' or 'mean'.")
+        self.streams = OrderedDict()
+
+    def window_spectrogram(self, stream):
+        """
+        Interpolates the buffered pings of a fish onto a [0..1] grid of desired_length steps,
+        like get_single_spectrogram does for sampled rows. Returns None if fewer than 2 pings.
+
+        The grid spans the window's first to last ping, so it moves with every ping and the
+        interpolated rows have to be recomputed. The buffer is read in place, each grid point
+        is bracketed by a binary search, and only the 2 * desired_length bracketing rows are
+        gathered: O(window + desired_length * num_freqs) per ping.
+        """
+        if stream.count < 2:
+            return None
+        times, features = stream.ordered()
+        times_sec = (times - times[0]) / 1e6
+        if times_sec[-1] == 0:
+            return np.repeat(features[:1].astype(np.float64), self.desired_length, axis=0)
+        norm_times = times_sec / times_sec[-1]
+        grid = np.linspace(0, 1, num=self.desired_length)
+
+        # Same brackets as interpolate_spectrograms (and np.interp)
+        left = np.clip(np.searchsorted(norm_times, grid, side='right') - 1, 0, stream.count - 1)
+        at_end = left == stream.count - 1
+        right = np.minimum(left + 1, stream.count - 1)
+        span = np.where(at_end, 1.0, norm_times[right] - norm_times[left])
+        weight = np.where(at_end, 0.0, (grid - norm_times[left]) / span)
+        f_left = features[left].astype(np.float64)
+        return f_left + weight[:, None] * (features[right] - f_left)
+
+    def update(self, fish, ping_us, features):
+        """
+        Adds one ping of a fish (pings of a fish must arrive in time order) and returns the
+        fish's current estimate: a dict with fishNum, log_odds, probability of classes[1],
+        predicted species and number of buffered pings.
+        """
+        features = np.asarray(features, dtype=np.float32)
+        stream = self.streams.get(fish)
+        if stream is None:
+            stream = FishStream(self.window, len(features))
+            self.streams[fish] = stream
+            if self.max_fish is not None and len(self.streams) > self.max_fish:
+                self.streams.popitem(last=False)
+        else:
+            self.streams.move_to_end(fish)
+
+        position = stream.push(ping_us, features)
+        if self.window_scorer is not None:
+            spectrogram = self.window_spectrogram(stream)
+            score = self.window_scorer(spectrogram) if spectrogram is not None else 0.0
+        else:
+            score = self.ping_scorer(features)
+        if not np.isfinite(score):
+            score = 0.0  # e.g. missing frequency values: no evidence either way
+        stream.scores[position] = score
+        stream.score_sum += score
+        return self.estimate(fish)
+
+    def estimate(self, fish):
+        """
+        Returns the current estimate of a fish (see update).
+        """
+        stream = self.streams[fish]
+        evidence = stream.score_sum / stream.count if self.aggregate == 'mean' else stream.score_sum
+        log_odds = self.prior_log_odds + evidence
+        probability = 0.5 * (1.0 + np.tanh(0.5 * log_odds))  # sigmoid without overflow
+        return {'fishNum': fish, 'log_odds': log_odds, 'probability': probability,
+                'species': self.classes[int(log_odds > 0)], 'pings': stream.count}
+
+def replay(data):
+    """
+    Replays a loaded dataset (DataFrame or FishPingDataset) as a ping stream: yields
+    (fishNum, ping_us, features) in chronological order across all fish.
+    """
+    dataset = data if isinstance(data, FishPingDataset) else FishPingDataset(data)
+    for row in np.argsort(dataset.ping_us, kind='stable'):
+        yield dataset.fish[row], dataset.ping_us[row], dataset.features[row]
@@ -0,0 +1,355 @@
+"""
+Successive-halving / Hyperband hyperparameter sweeps for the MLP and CNN fold trainings.
+
+Configurations (e.g. lr, l1_lambda, batch_size, and the preprocessing parameters noise_std and
+desired_length) are sampled from a search space. The training budget is the number of epochs.
+Each rung trains every surviving configuration with K-fold cross-validation up to the rung's
+budget, scores it by its mean validation accuracy, and promotes the best 1/eta to the next rung
+with eta times more epochs. Promoted configurations continue from their fold checkpoints; SGD
+momentum restarts at each rung. hyperband() runs several such brackets, trading the number of
+configurations against their starting budget.
+
+The trials of a rung run concurrently on a process pool. Preprocessed tensors (synthetic
+samples, spectrograms) depend only on the data, the seed and the data parameters of a
+configuration; they are built once, cached on disk in the sweep folder and kept in memory by
+each worker. The MLP inputs are standardized inside each fold with the statistics of its
+training rows, so the validation rows do not leak into the scaling. Every finished (trial,
+rung) is appended to <sweep folder>/log.jsonl, so an interrupted sweep picks up where it
+stopped when run again with the same arguments. Trial ids start with a hash of the data,
+seed and number of folds and end with a hash of the configuration and bracket schedule, so
+a run with other ones does not reuse these results; logged results and checkpoints are also
+checked against the configuration before they are reused.
+
+Example:
+    python sweep.py --model mlp --data ../Data/sample_data.csv --dir ../Output/sweep_mlp \
+        --min-epochs 50 --max-epochs 2000 --eta 3 --n-jobs 4
+"""
+import os
+import json
+import time
+import math
+import hashlib
+import argparse
+import functools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import torch
+from threadpoolctl import threadpool_limits
+from sklearn.model_selection import StratifiedKFold
+from load_dataset import load_from_path, frame_fingerprint, frequency_columns
+from module import generate_synthetic_samples_for_class_batched
+from spectrogram import get_class_spectrograms_batched
+from models import MLP, MLP_L1, CNNClassifier
+from trainer import train_model, evaluate_accuracy
+from parallel_cv import threads_per_worker
+
+# Data preparation and models for the two trainings. A data function takes (df, seed, **data
+# params) and returns (X, Y); a model function takes (config, X) and returns a new model.
+def mlp_data(df, seed = 0, noise_std = 1, samples_per_class = 1000):
+    """
+    Synthetic samples of both classes (as in '3. MLP.ipynb'), unscaled with missing values
+    kept; LT = 0, SMB = 1. Use with Sweep(standardize=True) to scale them per fold.
+    """
+    rng = np.random.default_rng(seed)
+    synthetic_df = pd.concat([generate_synthetic_samples_for_class_batched(df, spe, samples_per_class, noise_std, rng)
+                              for spe in ['LT', 'SMB']], ignore_index=True)
+    X = synthetic_df[frequency_columns(synthetic_df.columns)].to_numpy(dtype=np.float64)
+    Y = (synthetic_df['Spe'] == 'SMB').to_numpy()
+    return torch.tensor(X, dtype=torch.float32), torch.tensor(Y, dtype=torch.long)
+
+def cnn_data(df, seed = 0, desired_length = 50, number_per_class = 200):
+    """
+    Spectrograms of both classes (as in '4. CNN.ipynb'), shape (N, 1, desired_length, num_freqs).
+    """
+    np.random.seed(seed)
+    specs = [get_class_spectrograms_batched(df, spe, desired_length, number_per_class, seed) for spe in ['LT', 'SMB']]
+    X = np.nan_to_num(np.concatenate(specs))[:, np.newaxis]
+    Y = np.repeat([0, 1], [len(spec) for spec in specs])
+    return torch.tensor(X, dtype=torch.float32), torch.tensor(Y, dtype=torch.long)
+
+def standardize(X_train, X_val):
+    """
+    Standardizes the training and validation inputs with the mean and std of the training
+    rows only; missing values become 0.
+    """
+    values = X_train.numpy().astype(np.float64)
+    mean = np.nanmean(values, axis=0)
+    std = np.nanstd(values, axis=0)
+    std = np.where(std > 0, std, 1.0)
+    scale = lambda X: torch.tensor(np.nan_to_num((X.numpy() - mean) / std), dtype=torch.float32)
+    return scale(X_train), scale(X_val)
+
+def mlp_model(config, X):
+    return (MLP_L1 if config.get('l1_lambda', 0) > 0 else MLP)(X.shape[1])
+
+def cnn_model(config, X):
+    return CNNClassifier(X.shape[-1], X.shape[-2])
+
+DATA_PARAMS = ('noise_std', 'desired_length', 'samples_per_class', 'number_per_class')
+
+def sample_configs(space, num_configs, rng):
+    """
+    Draws num_configs configurations: every entry of space is a list of values (drawn
+    uniformly) or a function rng -> value.
+    """
+    configs = []
+    for _ in range(num_configs):
+        config = {}
+        for name, values in space.items():
+            value = values(rng) if callable(values) else values[rng.integers(len(values))]
+            config[name] = value.item() if isinstance(value, np.generic) else value
+        configs.append(config)
+    return configs
+
+def _hash(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()[:16]
+
+# State shared by the trials of a worker process, set once by _init_worker
+_worker = {}
+
+def _init_worker(num_threads, data_fn, model_fn, sweep_dir, n_splits, seed, data_id, standardize):
+    torch.set_num_threads(num_threads)
+    _worker['limits'] = threadpool_limits(limits=num_threads)
+    _worker.update(data_fn=data_fn, model_fn=model_fn, sweep_dir=sweep_dir, n_splits=n_splits, seed=seed,
+                   data_id=data_id, standardize=standardize, data={})
+
+def _load_data(data_config):
+    """
+    Returns the (X, Y) tensors of the data parameters, from memory, the on-disk cache, or built once.
+    """
+    key = _hash({'data': _worker['data_id'], 'seed': _worker['seed'], **data_config})
+    if key not in _worker['data']:
+        path = os.path.join(_worker['sweep_dir'], 'data', f'{key}.pt')
+        if os.path.exists(path):
+            X, Y = torch.load(path)
+        else:
+            X, Y = _worker['data_fn'](seed=_worker['seed'], **data_config)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            torch.save((X, Y), tmp_path)
+            os.replace(tmp_path, path)
+        _worker['data'][key] = (X, Y)
+    return _worker['data'][key]
+
+def _checkpoint_path(trial_id, budget, fold):
+    return os.path.join(_worker['sweep_dir'], 'checkpoints', f'{trial_id}_e{budget}_fold{fold}.pt')
+
+def _load_checkpoint(trial_id, budget, fold, config):
+    """
+    Returns the state_dict saved for the fold at budget epochs, or None if there is none or it
+    belongs to another configuration.
+    """
+    path = _checkpoint_path(trial_id, budget, fold)
+    if not os.path.exists(path):
+        return None
+    checkpoint = torch.load(path)
+    return checkpoint['state_dict'] if checkpoint.get('config') == config else None
+
+def _run_trial(trial_id, config, budget, previous_budget):
+    """
+    Trains every fold of a configuration from previous_budget (0 = from scratch) up to budget
+    epochs and returns the rung result. A fold without a matching checkpoint at
+    previous_budget is trained from scratch for the whole budget instead.
+    """
+    start = time.perf_counter()
+    data_config = {key: value for key, value in config.items() if key in DATA_PARAMS}
+    X, Y = _load_data(data_config)
+    seed = _worker['seed']
+    folds = StratifiedKFold(n_splits=_worker['n_splits'], shuffle=True, random_state=seed).split(X, Y)
+
+    fold_accuracies = []
+    fold_val_losses = []
+    trained_from = []
+    for fold, (train_index, val_index) in enumerate(folds):
+        X_train, X_val = X[train_index], X[val_index]
+        if _worker['standardize']:
+            X_train, X_val = standardize(X_train, X_val)
+        torch.manual_seed(seed + fold)
+        model = _worker['model_fn'](config, X)
+        start_budget = 0
+        if previous_budget > 0:
+            state_dict = _load_checkpoint(trial_id, previous_budget, fold, config)
+            if state_dict is not None:
+                model.load_state_dict(state_dict)
+                start_budget = previous_budget
+        trained_from.append(start_budget)
+        # Seed the mini-batch order of this stretch of training
+        torch.manual_seed(seed + fold + 1000 * start_budget)
+        _, val_losses = train_model(model, X_train, Y[train_index], X_val, Y[val_index],
+                                    num_epochs=budget - start_budget, lr=config.get('lr', 0.001),
+                                    l1_lambda=config.get('l1_lambda', 0), batch_size=config.get('batch_size'),
+                                    val_every=max(1, (budget - start_budget) // 10))
+        torch.save({'config': config, 'state_dict': model.state_dict()}, _checkpoint_path(trial_id, budget, fold))
+        fold_accuracies.append(evaluate_accuracy(model, X_val, Y[val_index]))
+        fold_val_losses.append(val_losses)
+
+    return {'trial_id': trial_id, 'config': config, 'budget': budget, 'score': float(np.mean(fold_accuracies)),
+            'fold_accuracies': fold_accuracies, 'val_losses': fold_val_losses, 'trained_from': trained_from,
+            'seconds': time.perf_counter() - start}
+
+class Sweep:
+    """
+    A resumable sweep: a worker pool, the on-disk log and the data/checkpoint caches in sweep_dir.
+
+    Parameters:
+        data_fn (function): (seed=, **data params) -> (X, Y), e.g. functools.partial(mlp_data, df).
+            Must be picklable (a module-level function or a partial of one).
+        model_fn (function): (config, X) -> new model, e.g. mlp_model.
+        sweep_dir (str): Folder of log.jsonl, data/ and checkpoints/.
+        n_splits (int): Number of cross-validation folds per trial.
+        seed (int): Seed of the configurations, folds, data and models.
+        n_jobs (int): Concurrent trials (-1 for one per core).
+        num_threads (int, optional): Torch/BLAS threads per worker (default: cores / n_jobs).
+        data_id (optional): JSON-serializable identity of the data data_fn prepares from
+            (e.g. its path and load_dataset.frame_fingerprint). It is part of the data cache
+            keys and trial ids, with the seed and n_splits.
+        standardize (bool): Standardize the inputs of each fold with the statistics of its
+            training rows (for mlp_data).
+    """
+    def __init__(self, data_fn, model_fn, sweep_dir, n_splits = 5, seed = 0, n_jobs = -1, num_threads = None,
+                 data_id = None, standardize = False):
+        self.data_fn = data_fn
+        self.model_fn = model_fn
+        self.sweep_dir = sweep_dir
+        self.n_splits = n_splits
+        self.seed = seed
+        self.data_id = data_id
+        self.standardize = standardize
+        self.run_id = _hash({'data': data_id, 'seed': seed, 'n_splits': n_splits})[:8]
+        self.n_jobs = n_jobs if n_jobs is not None and n_jobs > 0 else os.cpu_count()
+        self.num_threads = num_threads or threads_per_worker(self.n_jobs)
+        self.log_path = os.path.join(sweep_dir, 'log.jsonl')
+        for folder in ('data', 'checkpoints'):
+            os.makedirs(os.path.join(sweep_dir, folder), exist_ok=True)
+        self.results = {}
+        if os.path.exists(self.log_path):
+            with open(self.log_path) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.results[(record['trial_id'], record['budget'])] = record
+
+    def _log(self, record):
+        self.results[(record['trial_id'], record['budget'])] = record
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def run_rung(self, executor, trials, budget, previous_budget):
+        """
+        Evaluates trials ({trial_id: config}) at budget epochs, reusing the logged results of
+        the same configuration and rung. Returns {trial_id: score}.
+        """
+        futures = {}
+        for trial_id, config in trials.items():
+            record = self.results.get((trial_id, budget))
+            if record is None or record['config'] != config or record.get('previous_budget') != previous_budget:
+                futures[trial_id] = executor.submit(_run_trial, trial_id, config, budget, previous_budget)
+        for trial_id, future in futures.items():
+            record = future.result()
+            record['previous_budget'] = previous_budget
+            self._log(record)
+            print(f"{trial_id} {budget:>6} epochs: accuracy {record['score']:.4f} {record['config']}")
+        return {trial_id: self.results[(trial_id, budget)]['score'] for trial_id in trials}
+
+    def successive_halving(self, executor, configs, min_epochs, max_epochs, eta = 3, bracket = 0):
+        """
+        Runs one successive-halving bracket over configs, starting at min_epochs and
+        multiplying the budget by eta (capped at max_epochs) while keeping the best 1/eta.
+        Returns the trial ids of the final rung with their scores.
+        """
+        schedule = {'min_epochs': min_epochs, 'max_epochs': max_epochs, 'eta': eta}
+        trials = {f'{self.run_id}-b{bracket}-t{i}-{_hash({"config": config, **schedule})[:8]}': config
+                  for i, config in enumerate(configs)}
+        budget, previous_budget = min_epochs, 0
+        while True:
+            scores = self.run_rung(executor, trials, budget, previous_budget)
+            num_kept = len(trials) // eta
+            if budget >= max_epochs or num_kept < 1:
+                return scores
+            kept = sorted(trials, key=lambda trial_id: -scores[trial_id])[:num_kept]
+            for trial_id in trials:
+                if trial_id not in kept:
+                    self._remove_checkpoints(trial_id)
+            trials = {trial_id: trials[trial_id] for trial_id in kept}
+            budget, previous_budget = min(budget * eta, max_epochs), budget
+
+    def _remove_checkpoints(self, trial_id):
+        folder = os.path.join(self.sweep_dir, 'checkpoints')
+        for name in os.listdir(folder):
+            if name.startswith(f'{trial_id}_'):
+                os.remove(os.path.join(folder, name))
+
+    def _executor(self):
+        return ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_init_worker,
+                                   initargs=(self.num_threads, self.data_fn, self.model_fn, self.sweep_dir,
+                                             self.n_splits, self.seed, self.data_id, self.standardize))
+
+    def hyperband(self, space, min_epochs, max_epochs, eta = 3):
+        """
+        Runs the Hyperband brackets s = s_max..0, with s_max = floor(log_eta(max_epochs / min_epochs)):
+        bracket s starts ceil((s_max + 1) / (s + 1) * eta^s) configurations at max_epochs / eta^s
+        epochs. Configurations are drawn from space with the sweep seed, so a resumed sweep
+        draws the same ones. Returns the results table (see table).
+        """
+        s_max = int(math.floor(math.log(max_epochs / min_epochs, eta) + 1e-9))
+        rng = np.random.default_rng(self.seed)
+        with self._executor() as executor:
+            for s in range(s_max, -1, -1):
+                num_configs = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+                configs = sample_configs(space, num_configs, rng)
+                start_epochs = max(1, int(round(max_epochs / eta ** s)))
+                self.successive_halving(executor, configs, start_epochs, max_epochs, eta, bracket=s)
+        return self.table()
+
+    def halving(self, space, num_configs, min_epochs, max_epochs, eta = 3):
+        """
+        Runs a single successive-halving bracket over num_configs configurations drawn from space.
+        """
+        configs = sample_configs(space, num_configs, np.random.default_rng(self.seed))
+        with self._executor() as executor:
+            self.successive_halving(executor, configs, min_epochs, max_epochs, eta)
+        return self.table()
+
+    def table(self):
+        """
+        Returns every logged (trial, budget) result of this data, seed and number of folds as
+        a DataFrame, best first.
+        """
+        rows = [{'trial_id': record['trial_id'], 'budget': record['budget'], 'score': record['score'],
+                 'seconds': record['seconds'], **record['config']} for record in self.results.values()
+                if record['trial_id'].startswith(f'{self.run_id}-')]
+        if not rows:
+            return pd.DataFrame()
+        return pd.DataFrame(rows).sort_values(['budget', 'score'], ascending=False, ignore_index=True)
+
+MLP_SPACE = {'lr': [1e-4, 3e-4, 1e-3, 3e-3, 1e-2], 'l1_lambda': [0, 1e-4, 1e-3], 'noise_std': [0.01, 0.1, 1]}
+CNN_SPACE = {'lr': [1e-4, 5e-4, 1e-3, 5e-3], 'desired_length': [20, 50, 100], 'batch_size': [32]}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Hyperband sweep of the MLP or CNN fold training.')
+    parser.add_argument('--model', choices=['mlp', 'cnn'], default='mlp')
+    parser.add_argument('--data', default=os.path.join('..', 'Data', 'sample_data.csv'))
+    parser.add_argument('--dir', required=True, help='sweep folder (log, caches); rerun with the same folder to resume')
+    parser.add_argument('--min-epochs', type=int, default=50)
+    parser.add_argument('--max-epochs', type=int, default=2000)
+    parser.add_argument('--eta', type=int, default=3)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    args = parser.parse_args()
+
+    exclude = ['LT008', 'LT016'] + (['SMB009'] if args.model == 'cnn' else [])
+    df = load_from_path(args.data, ['LT', 'SMB'], exclude)
+    data_id = {'path': os.path.abspath(args.data), 'fingerprint': frame_fingerprint(df)}
+    if args.model == 'mlp':
+        sweep = Sweep(functools.partial(mlp_data, df), mlp_model, args.dir, args.folds, args.seed, args.n_jobs,
+                      data_id=data_id, standardize=True)
+        space = MLP_SPACE
+    else:
+        sweep = Sweep(functools.partial(cnn_data, df), cnn_model, args.dir, args.folds, args.seed, args.n_jobs,
+                      data_id=data_id)
+        space = CNN_SPACE
+    table = sweep.hyperband(space, args.min_epochs, args.max_epochs, args.eta)
+    print(table.head(20).to_string(index=False))
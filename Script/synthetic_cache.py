@@ -0,0 +1,180 @@
+"""
+Content-addressed on-disk cache of generated synthetic datasets.
+
+A cached result is keyed by a hash of the source data (file fingerprint or frame hash), the
+generator function and its code, its arguments (class, sample count, noise level, ...) and
+the seed. The code hash covers the source of the generator and of the functions of this
+repository it calls, so editing any of them invalidates the results they produced.
+Results are stored with load_dataset.write_cache (one .npy file per column) and memory-mapped
+back in by read_cache. The cache folder is bounded in size: after each write, least recently
+used entries are evicted until it fits in max_bytes.
+
+The cache is bypassed with use_cache=False or by setting STA2453_SYNTHETIC_CACHE=off.
+
+Example:
+    synthetic_df = cached_synthetic_samples_for_class(df, 'SMB', 20000, noise_std = 0.01, seed = 0)
+    augmented_df = cached_synthetic_dataset_from_path(data_path, samples_size = 20000, init_stat = 0)
+"""
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import inspect
+import numpy as np
+from load_dataset import file_fingerprint, frame_fingerprint, write_cache, read_cache
+from module import generate_synthetic_samples_for_class
+from resample import generate_synthetic_dataset_from_path
+from profiling import count
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data', '.cache', 'synthetic')
+DEFAULT_MAX_BYTES = 2 * 2**30
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def cache_enabled():
+    return os.environ.get('STA2453_SYNTHETIC_CACHE', '').lower() not in ('off', '0', 'false')
+
+def _code_objects(code):
+    # A code object and the ones nested in it (comprehensions, lambdas, inner functions)
+    yield code
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            yield from _code_objects(const)
+
+def code_fingerprint(fn):
+    """
+    Returns a hash of the source of fn and of every function of this repository it reaches
+    through the global names it uses (e.g. the per-row helpers of a generator).
+    """
+    functions = {}
+    stack = [fn]
+    while stack:
+        function = inspect.unwrap(stack.pop())
+        if not inspect.isfunction(function) or os.path.dirname(os.path.abspath(function.__code__.co_filename)) != SCRIPT_DIR:
+            continue
+        name = f'{function.__module__}.{function.__qualname__}'
+        if name in functions:
+            continue
+        functions[name] = inspect.getsource(function)
+        for code in _code_objects(function.__code__):
+            stack.extend(function.__globals__[global_name] for global_name in code.co_names
+                         if global_name in function.__globals__)
+    digest = hashlib.sha1()
+    for name in sorted(functions):
+        digest.update(name.encode())
+        digest.update(functions[name].encode())
+    return digest.hexdigest()
+
+def cache_key(source_fingerprint, fn, seed, **kwargs):
+    """
+    Returns the cache key of fn (its name and code_fingerprint) applied to a source with the
+    given arguments and seed.
+    """
+    description = {'source': source_fingerprint, 'function': f'{fn.__module__}.{fn.__qualname__}',
+                   'code': code_fingerprint(fn), 'seed': seed,
+                   'kwargs': {key: repr(value) for key, value in sorted(kwargs.items())}}
+    return hashlib.sha1(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+def _seeded_call(fn, data, seed, kwargs):
+    # Seed the global RNG (used by the per-row generators) and pass the seed to the
+    # generator's own seed argument if it has one
+    parameters = inspect.signature(fn).parameters
+    kwargs = dict(kwargs)
+    if 'rng' in parameters:
+        kwargs['rng'] = seed
+    elif 'init_stat' in parameters:
+        kwargs['init_stat'] = seed
+    np.random.seed(seed)
+    return fn(data, **kwargs)
+
+def _entry_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+def evict(cache_dir = DEFAULT_CACHE_DIR, max_bytes = DEFAULT_MAX_BYTES, keep = ()):
+    """
+    Removes the least recently used entries until the cache holds at most max_bytes.
+    Entries named in keep are never removed.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for entry in os.scandir(cache_dir):
+        meta_path = os.path.join(entry.path, 'meta.json')
+        if entry.is_dir() and os.path.exists(meta_path):
+            entries.append((os.stat(meta_path).st_mtime, entry.name, _entry_size(entry.path)))
+    total = sum(size for _, _, size in entries)
+    for _, name, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name in keep:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        count('synthetic_cache.evictions')
+        total -= size
+
+def clear_cache(cache_dir = DEFAULT_CACHE_DIR):
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+def cached_call(fn, data, seed = 0, cache_dir = DEFAULT_CACHE_DIR, max_bytes = DEFAULT_MAX_BYTES,
+                use_cache = True, refresh = False, **kwargs):
+    """
+    Returns fn(data, **kwargs) with the given seed, from the cache if possible.
+
+    Parameters:
+        fn (function): A synthetic data generator taking a DataFrame or a data path first.
+        data (pd.DataFrame or str): The source data; a path is fingerprinted with
+            load_dataset.file_fingerprint, a DataFrame by hashing its content.
+        seed (int): Passed as the generator's rng or init_stat argument, and used to seed
+            the global NumPy RNG before the call.
+        cache_dir (str): Cache folder (default: Data/.cache/synthetic).
+        max_bytes (int): Size bound of the cache folder.
+        use_cache (bool): If False, fn is simply called (also with STA2453_SYNTHETIC_CACHE=off).
+        refresh (bool): Recompute and overwrite the cached result.
+        **kwargs: Arguments of fn, part of the key.
+
+    Returns:
+        pd.DataFrame, memory-mapped from the cache.
+    """
+    if not use_cache or not cache_enabled():
+        return _seeded_call(fn, data, seed, kwargs)
+
+    source = file_fingerprint(data) if isinstance(data, (str, os.PathLike)) else frame_fingerprint(data)
+    key = cache_key(source, fn, seed, **kwargs)
+    entry_dir = os.path.join(cache_dir, key)
+    if not refresh:
+        df = read_cache(entry_dir, key)
+        if df is not None:
+            os.utime(os.path.join(entry_dir, 'meta.json'))  # mark as recently used
+            count('synthetic_cache.hits')
+            return df
+    count('synthetic_cache.misses')
+
+    result = _seeded_call(fn, data, seed, kwargs)
+    # Write to a private folder first, then move it into place
+    tmp_dir = os.path.join(cache_dir, f'.tmp-{uuid.uuid4().hex}')
+    write_cache(result, tmp_dir, key, features_dtype=np.float64)
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    try:
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        # Another process stored the same entry meanwhile
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    evict(cache_dir, max_bytes, keep=(key,))
+    df = read_cache(entry_dir, key)
+    return df if df is not None else result
+
+def cached_synthetic_samples_for_class(df, spe_value, desired_sample_size, noise_std = 1, seed = 0,
+                                       generator = generate_synthetic_samples_for_class, **cache_kwargs):
+    """
+    Cached module.generate_synthetic_samples_for_class (or another per-class generator with
+    the same arguments, e.g. generate_synthetic_samples_for_class_batched).
+    """
+    return cached_call(generator, df, seed, spe_value=spe_value, desired_sample_size=desired_sample_size,
+                       noise_std=noise_std, **cache_kwargs)
+
+def cached_synthetic_dataset_from_path(data_path, samples_size = 20000, noise_std = 1, init_stat = 0, **cache_kwargs):
+    """
+    Cached resample.generate_synthetic_dataset_from_path.
+    """
+    return cached_call(generate_synthetic_dataset_from_path, data_path, init_stat, samples_size=samples_size,
+                       noise_std=noise_std, **cache_kwargs)
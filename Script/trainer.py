@@ -0,0 +1,350 @@
+import copy
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+import torch.nn.functional as F
+from torch.func import stack_module_state, functional_call, vmap
+from torch.utils.data import DataLoader, TensorDataset, BatchSampler, RandomSampler
+from profiling import profiled, stage, record_throughput
+
+def average_models(model_list, model_fn, device):
+    """
+    Averages the parameters (state_dicts) of a list of models and returns a new model with averaged parameters.
+
+    Parameters:
+        model_list (list): List of trained models (nn.Module) with identical architecture.
+        model_fn (function): A function that returns a new instance of the model.
+        device (torch.device): The device on which to place the final model.
+
+    Returns:
+        final_model (nn.Module): A new model instance whose parameters are the average of those in model_list.
+    """
+    # Get the keys from the first model's state dict
+    avg_state_dict = {}
+    state_dicts = [model.state_dict() for model in model_list]
+    for key in state_dicts[0].keys():
+        # Sum the corresponding tensors across models
+        avg_state_dict[key] = sum(state_dict[key] for state_dict in state_dicts) / len(state_dicts)
+    # Create new model and load the averaged state dict
+    final_model = model_fn().to(device)
+    final_model.load_state_dict(avg_state_dict)
+    return final_model
+
+def make_batches(X, Y, batch_size = None):
+    """
+    Returns an iterable of (inputs, labels) mini-batches for one epoch.
+
+    With batch_size None the whole set is a single batch (full-batch training). Otherwise a
+    DataLoader draws shuffled index batches and slices the tensors once per batch, instead
+    of collating individual rows.
+    """
+    if batch_size is None or batch_size >= len(X):
+        return [(X, Y)]
+    dataset = TensorDataset(X, Y)
+    sampler = BatchSampler(RandomSampler(dataset), batch_size=batch_size, drop_last=False)
+    return DataLoader(dataset, sampler=sampler, batch_size=None)
+
+def l1_penalty(model):
+    """
+    Returns the L1 norm of all parameters of the model.
+    """
+    return sum(p.abs().sum() for p in model.parameters())
+
+@profiled()
+def train_model(model, X_train, Y_train, X_val = None, Y_val = None, num_epochs = 100, lr = 0.001, l1_lambda = 0,
+                batch_size = None, val_every = 1, patience = None, device = torch.device("cpu")):
+    """
+    Trains a model in place using SGD (momentum 0.9) with optional L1 regularization.
+
+    Losses are accumulated on the device and copied to the host once at the end, so there
+    is no .item() sync per step. The only per-epoch sync is the early stopping check.
+
+    Parameters:
+        model (nn.Module): The model to train (already on device).
+        X_train, Y_train (torch.Tensor): Training features and labels.
+        X_val, Y_val (torch.Tensor, optional): Validation features and labels.
+        num_epochs (int): Maximum number of epochs.
+        lr (float): Learning rate for SGD.
+        l1_lambda (float, optional): Coefficient for L1 regularization (default=0).
+        batch_size (int, optional): Mini-batch size; None trains on the full batch each epoch.
+        val_every (int): Compute the validation loss every val_every epochs.
+        patience (int, optional): Stop after this many validation checks without improvement
+            and restore the best weights. None disables early stopping.
+        device (torch.device): Device to run on (e.g., CPU or CUDA).
+
+    Returns:
+        train_losses (list): Training loss of each epoch that was run.
+        val_losses (list): Validation loss of each validation check (every val_every epochs).
+    """
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.SGD(model.parameters(), lr=lr, momentum=0.9)
+    validate = X_val is not None
+
+    train_history = torch.zeros(num_epochs, device=device)
+    val_history = torch.zeros(num_epochs // val_every if validate else 0, device=device)
+    best_val_loss = float('inf')
+    best_state = None
+    checks_without_improvement = 0
+    epochs_run = 0
+    num_checks = 0
+
+    for epoch in range(num_epochs):
+        model.train()
+        epoch_loss = torch.zeros((), device=device)
+        for inputs, labels in make_batches(X_train, Y_train, batch_size):
+            inputs, labels = inputs.to(device), labels.to(device)
+            optimizer.zero_grad()
+            outputs = model(inputs)
+            loss = criterion(outputs, labels)
+            if l1_lambda > 0:
+                loss = loss + l1_lambda * l1_penalty(model)
+            loss.backward()
+            optimizer.step()
+            epoch_loss += loss.detach() * len(inputs)
+        train_history[epoch] = epoch_loss / len(X_train)
+        epochs_run = epoch + 1
+
+        if not validate or epochs_run % val_every != 0:
+            continue
+        model.eval()
+        with torch.no_grad():
+            val_loss = criterion(model(X_val), Y_val)
+            if l1_lambda > 0:
+                val_loss = val_loss + l1_lambda * l1_penalty(model)
+        val_history[num_checks] = val_loss
+        num_checks += 1
+
+        # Early stopping on the validation loss
+        if patience is not None:
+            val_loss = val_loss.item()
+            if val_loss < best_val_loss:
+                best_val_loss = val_loss
+                best_state = copy.deepcopy(model.state_dict())
+                checks_without_improvement = 0
+            else:
+                checks_without_improvement += 1
+                if checks_without_improvement >= patience:
+                    break
+
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    return train_history[:epochs_run].tolist(), val_history[:num_checks].tolist()
+
+def evaluate_accuracy(model, X, Y):
+    """
+    Returns the classification accuracy of the model on (X, Y).
+    """
+    model.eval()
+    with torch.no_grad():
+        _, predicted = torch.max(model(X), 1)
+        return (predicted == Y).float().mean().item()
+
+def train_and_evaluate_model(model_fn, X, Y, kf, num_epochs = 100, lr = 0.001, l1_lambda = 0, device = torch.device("cpu"),
+                             batch_size = None, val_every = 1, patience = None, seed = None, train_final = True):
+    """
+    Trains a model (constructed via model_fn) using SGD with optional L1 regularization,
+    performs K-Fold cross-validation while recording training and validation losses,
+    and then produces a final model by averaging the parameters from each fold.
+
+    Any of the models in models.py (MLP, MLP_Dropout, MLP_L1) can be used through model_fn,
+    e.g. model_fn = lambda: MLP_L1(input_dim).
+
+    Parameters:
+        model_fn (function): A function that returns a new model instance.
+        X (torch.Tensor): The features.
+        Y (torch.Tensor): The target labels.
+        kf (sklearn.model_selection.KFold): An instance of KFold (or StratifiedKFold) for splitting the data.
+        num_epochs (int): Number of epochs for training on each fold.
+        lr (float): Learning rate for SGD.
+        l1_lambda (float, optional): Coefficient for L1 regularization (default=0).
+        device (torch.device): Device to run on (e.g., CPU or CUDA).
+        batch_size (int, optional): Mini-batch size; None keeps full-batch training.
+        val_every (int): Compute the validation loss every val_every epochs.
+        patience (int, optional): Early stopping patience in validation checks; None disables it.
+        seed (int, optional): If given, torch is seeded with seed + fold index before each fold
+            (and seed + number of folds before the final model), making every fold reproducible
+            on its own.
+        train_final (bool): Whether to train the final model on the entire dataset.
+
+    Returns:
+        fold_accuracies (list): List of validation accuracies (one per fold).
+        all_fold_train_losses (list): List of training loss lists (one per fold, losses per epoch).
+        all_fold_val_losses (list): List of validation loss lists (one per fold, losses per validation check).
+        average_model (nn.Module): The model produced by averaging parameters from each fold.
+        final_model (nn.Module): A model trained on the entire dataset (None if train_final is False).
+    """
+    fold_accuracies = []
+    all_fold_train_losses = []
+    all_fold_val_losses = []
+    fold_models = []  # To store the final model from each fold
+
+    fold_num = 1
+    for train_index, val_index in kf.split(X, Y.cpu()):
+        X_train = X[train_index]
+        Y_train = Y[train_index]
+        X_val = X[val_index]
+        Y_val = Y[val_index]
+
+        if seed is not None:
+            torch.manual_seed(seed + fold_num - 1)
+        model = model_fn().to(device)
+        start = time.perf_counter()
+        with stage('trainer.train_fold', fold=fold_num):
+            fold_train_losses, fold_val_losses = train_model(
+                model, X_train, Y_train, X_val, Y_val, num_epochs, lr, l1_lambda,
+                batch_size = batch_size, val_every = val_every, patience = patience, device = device
+            )
+        # Samples/sec of the fold (training samples times epochs actually run), see profiling.py
+        record_throughput('trainer.train_fold', len(train_index) * len(fold_train_losses),
+                          time.perf_counter() - start, fold=fold_num)
+
+        acc = evaluate_accuracy(model, X_val, Y_val)
+        fold_accuracies.append(acc)
+        all_fold_train_losses.append(fold_train_losses)
+        all_fold_val_losses.append(fold_val_losses)
+        fold_models.append(model)
+        print(f"Fold {fold_num} Accuracy: {acc:.4f}")
+        fold_num += 1
+
+    print("\nMean CV Accuracy: {:.4f}".format(np.mean(fold_accuracies)))
+
+    # Average the parameters from the fold models.
+    average_model = average_models(fold_models, model_fn, device)
+
+    # Train final model on the entire dataset.
+    final_model = None
+    if train_final:
+        if seed is not None:
+            torch.manual_seed(seed + len(fold_models))
+        final_model = model_fn().to(device)
+        start = time.perf_counter()
+        with stage('trainer.train_fold', fold='final'):
+            train_model(final_model, X, Y, num_epochs = num_epochs, lr = lr, l1_lambda = l1_lambda,
+                        batch_size = batch_size, device = device)
+        record_throughput('trainer.train_fold', len(X) * num_epochs, time.perf_counter() - start, fold='final')
+
+    return fold_accuracies, all_fold_train_losses, all_fold_val_losses, average_model, final_model
+
+def train_and_evaluate_model_ensemble(model_fn, X, Y, kf, num_epochs = 100, lr = 0.001, l1_lambda = 0, device = torch.device("cpu"),
+                                      seed = None, train_final = True):
+    """
+    Trains all fold models (and the final model) of train_and_evaluate_model together as one
+    batched ensemble.
+
+    The parameters of the structurally identical fold models are stacked and the models are
+    run with torch.func.vmap over the shared data. Per-fold masks select each fold's training
+    and validation rows, so one forward/backward pass per epoch replaces one per fold. The
+    final model on the entire dataset is one more ensemble member with an all-ones mask.
+    Training is full-batch SGD (momentum 0.9), and with the same seed the results match
+    train_and_evaluate_model(..., seed=seed) up to floating point rounding.
+
+    Parameters:
+        model_fn, X, Y, kf, num_epochs, lr, l1_lambda, device, seed, train_final:
+            As in train_and_evaluate_model.
+
+    Returns:
+        fold_accuracies, all_fold_train_losses, all_fold_val_losses, average_model, final_model
+        as in train_and_evaluate_model; average_model is built directly from the stacked parameters.
+    """
+    X, Y = X.to(device), Y.to(device)
+    folds = list(kf.split(X, Y.cpu()))
+    num_folds = len(folds)
+    num_members = num_folds + (1 if train_final else 0)
+
+    # Row masks of each ensemble member over the shared data
+    train_mask = torch.zeros(num_members, len(X), device=device)
+    val_mask = torch.zeros(num_members, len(X), device=device)
+    for k, (train_index, val_index) in enumerate(folds):
+        train_mask[k, torch.as_tensor(train_index, device=device)] = 1
+        val_mask[k, torch.as_tensor(val_index, device=device)] = 1
+    if train_final:
+        train_mask[num_folds] = 1
+    train_count = train_mask.sum(dim=1)
+    val_count = val_mask.sum(dim=1).clamp(min=1)
+
+    # Initialize every member exactly like the sequential folds
+    members = []
+    for k in range(num_members):
+        if seed is not None:
+            torch.manual_seed(seed + k)
+        members.append(model_fn().to(device))
+    params, buffers = stack_module_state(members)
+    base_model = copy.deepcopy(members[0]).to('meta')
+
+    def call_member(member_params, member_buffers, inputs):
+        return functional_call(base_model, (member_params, member_buffers), (inputs,))
+    ensemble_forward = vmap(call_member, in_dims=(0, 0, None), randomness='different')
+
+    def member_losses(logits, mask, count):
+        # Masked mean cross-entropy of every member, plus its own L1 penalty
+        per_row = F.cross_entropy(logits.reshape(-1, logits.shape[-1]), Y.repeat(num_members), reduction='none')
+        losses = (per_row.view(num_members, -1) * mask).sum(dim=1) / count
+        if l1_lambda > 0:
+            losses = losses + l1_lambda * sum(p.abs().flatten(start_dim=1).sum(dim=1) for p in params.values())
+        return losses
+
+    # Without dropout or batch norm the next epoch's training forward pass already gives the
+    # validation outputs of the updated parameters, so the separate eval pass can be skipped.
+    mode_dependent = any(isinstance(m, (nn.Dropout, nn.modules.batchnorm._BatchNorm)) for m in members[0].modules())
+
+    optimizer = optim.SGD(params.values(), lr=lr, momentum=0.9)
+    train_history = torch.zeros(num_epochs, num_members, device=device)
+    val_history = torch.zeros(num_epochs, num_members, device=device)
+    start = time.perf_counter()
+    for epoch in range(num_epochs):
+        base_model.train()
+        optimizer.zero_grad()
+        logits = ensemble_forward(params, buffers, X)
+        if epoch > 0 and not mode_dependent:
+            with torch.no_grad():
+                val_history[epoch - 1] = member_losses(logits, val_mask, val_count)
+        losses = member_losses(logits, train_mask, train_count)
+        losses.sum().backward()
+        optimizer.step()
+        train_history[epoch] = losses.detach()
+
+        if mode_dependent:
+            base_model.eval()
+            with torch.no_grad():
+                val_history[epoch] = member_losses(ensemble_forward(params, buffers, X), val_mask, val_count)
+
+    # All members share the training time; report each member's samples/sec over it
+    seconds = time.perf_counter() - start
+    for k, count in enumerate(train_count.tolist()):
+        record_throughput('trainer.train_fold', int(count) * num_epochs, seconds,
+                          fold=k + 1 if k < num_folds else 'final', ensemble=True)
+
+    base_model.eval()
+    with torch.no_grad():
+        logits = ensemble_forward(params, buffers, X)
+        if num_epochs > 0 and not mode_dependent:
+            val_history[num_epochs - 1] = member_losses(logits, val_mask, val_count)
+        predicted = logits.argmax(dim=-1)
+        correct = ((predicted == Y).float() * val_mask).sum(dim=1)
+    fold_accuracies = (correct / val_count)[:num_folds].tolist()
+    for fold_num, acc in enumerate(fold_accuracies, start=1):
+        print(f"Fold {fold_num} Accuracy: {acc:.4f}")
+    print("\nMean CV Accuracy: {:.4f}".format(np.mean(fold_accuracies)))
+
+    train_history = train_history.T.tolist()
+    val_history = val_history.T.tolist()
+    all_fold_train_losses = train_history[:num_folds]
+    all_fold_val_losses = val_history[:num_folds]
+
+    def member_state(select):
+        state = {key: select(value.detach()) for key, value in params.items()}
+        state.update({key: select(value) for key, value in buffers.items()})
+        return state
+
+    # Average the parameters of the fold members directly from the stacked tensors
+    average_model = model_fn().to(device)
+    average_model.load_state_dict(member_state(lambda value: value[:num_folds].mean(dim=0)))
+
+    final_model = None
+    if train_final:
+        final_model = model_fn().to(device)
+        final_model.load_state_dict(member_state(lambda value: value[num_folds]))
+
+    return fold_accuracies, all_fold_train_losses, all_fold_val_losses, average_model, final_model